@@ -1,12 +1,89 @@
-from flask import Flask, jsonify, render_template, request
+from flask import (Flask, Response, before_render_template, g, jsonify, render_template, request,
+                   template_rendered)
+import bisect
 import datetime
+import functools
+import hashlib
+import json
+import math
 import os
-from typing import Dict, List, Optional
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 from dataclasses import dataclass
+from urllib.parse import quote
+
+import click
+from werkzeug.datastructures import ETags
+from werkzeug.http import http_date, quote_etag
+
+from area_names import AreaNameIndex
+from calendar_feed import build_area_calendar
+from clock import load_clock, minute_of_day
+from dataset import MINUTES_PER_DAY, ScheduleDataset, Slot, export_sqlite, load_dataset
+from metrics import Registry, load_profiler
+from overrides import OVERRIDE_STATUSES, OverrideEvent, OverrideSet, OverrideTimeline, load_override_store
+from shared_state import load_status_state
+from snapshot import FORMAT_VERSION as SNAPSHOT_FORMAT, CompiledSnapshot, load_snapshot, write_snapshot
+from stats import OutageStats
+from transitions import TransitionHub, TransitionScheduler
+from writes import RateLimiter, StatusWriter, client_address
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; bulk lookups fall back to bisect
+    np = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the json module is used instead
+    orjson = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
+# Source of "now" for every route and the status logic, in the schedule zone.
+# Replace it (e.g. with clock.FrozenClock) to evaluate schedules at other times.
+clock = load_clock()
+
+# Metrics exposed on /metrics (per worker process)
+metrics = Registry()
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "Time spent handling a request, by route", ("method", "route", "status"))
+PHASE_LATENCY = metrics.histogram(
+    "schedule_phase_duration_seconds",
+    "Time spent in schedule generation, HH:MM parsing into indexes and template rendering", ("phase",))
+SCHEDULE_REGENERATIONS = metrics.counter(
+    "schedule_regenerations_total", "Area schedules generated from the base slots", ("economic_status",))
+SCHEDULE_ACTIVATIONS = metrics.counter(
+    "schedule_activations_total", "Times a new set of compiled schedules became active")
+CACHE_LOOKUPS = metrics.counter(
+    "cache_lookups_total", "Lookups in the compiled-area, status snapshot, HTTP and page caches",
+    ("cache", "result"))
+COMPILED_AREA_HIT = CACHE_LOOKUPS.labels("compiled_area", "hit")
+COMPILED_AREA_MISS = CACHE_LOOKUPS.labels("compiled_area", "miss")
+SNAPSHOT_HIT = CACHE_LOOKUPS.labels("status_snapshot", "hit")
+SNAPSHOT_MISS = CACHE_LOOKUPS.labels("status_snapshot", "miss")
+HTTP_CACHE_HIT = CACHE_LOOKUPS.labels("http", "hit")
+HTTP_CACHE_MISS = CACHE_LOOKUPS.labels("http", "miss")
+PAGE_CACHE_HIT = CACHE_LOOKUPS.labels("page", "hit")
+PAGE_CACHE_MISS = CACHE_LOOKUPS.labels("page", "miss")
+CALENDAR_CACHE_HIT = CACHE_LOOKUPS.labels("calendar", "hit")
+CALENDAR_CACHE_MISS = CACHE_LOOKUPS.labels("calendar", "miss")
+OVERRIDE_TIMELINE_BUILDS = metrics.counter(
+    "override_timeline_builds_total", "Area override timelines built from override events")
+SINGLE_FLIGHT_WAITS = metrics.counter(
+    "single_flight_waits_total", "Callers that waited for a build another caller had already started", ("build",))
+WRITES_THROTTLED = metrics.counter(
+    "writes_throttled_total", "Write requests refused by the rate limiter")
+STATUS_WRITES_COALESCED = metrics.counter(
+    "status_writes_coalesced_total", "Economic status writes applied by another request's activation")
+
+# cProfile hook, off unless SCHEDULE_PROFILE_REQUESTS is set
+profiler = load_profiler()
+
 
 # Configuration and Data Models
 
@@ -51,6 +128,22 @@ ECONOMIC_STATUSES = {
 # Default economic status (can be changed via API)
 current_economic_status = "moderate"
 
+# Upper bound on the timestamps accepted by one bulk status request
+MAX_BULK_TIMESTAMPS = 1440
+
+# Upper bound on the days one timeline export can span
+MAX_TIMELINE_DAYS = 366
+
+# Upper bound on the results of one area search
+MAX_SEARCH_RESULTS = 50
+
+# Upper bounds on the scenarios of one simulation and on their multipliers
+MAX_SIMULATION_SCENARIOS = 16
+MAX_SIMULATION_MULTIPLIER = 10.0
+
+# Upper bound on the events one override request can add
+MAX_OVERRIDE_EVENTS = 1000
+
 # Municipality and area data
 MUNICIPALITIES = [
     {"name": "Luanda", "areas": ["Maianga",
@@ -352,91 +445,859 @@ def minutes_to_time(minutes: int) -> str:
     return f"{hours:02d}:{minutes:02d}"
 
 
+# Shortest slot a generated schedule may contain, in minutes
+MIN_SLOT_MINUTES = 30
+
+
+def rescale_durations(durations: List[int], power_on: List[bool],
+                      power_on_multiplier: float, power_off_multiplier: float) -> List[int]:
+    """
+    Apply economic multipliers to slot durations and renormalize the result so
+    it sums to exactly 24 hours. Slots never drop below MIN_SLOT_MINUTES;
+    the rest of the day is shared proportionally by the other slots, and
+    rounding leftovers go to the slots with the largest fractional parts.
+    """
+    scaled = [
+        duration * (power_on_multiplier if is_on else power_off_multiplier)
+        for duration, is_on in zip(durations, power_on)
+    ]
+    floor = min(MIN_SLOT_MINUTES, MINUTES_PER_DAY // len(scaled))
+
+    # Pin slots that would fall under the floor, then spread the remaining
+    # minutes over the free slots; repeat until no free slot is too short
+    pinned = [False] * len(scaled)
+    while True:
+        free_total = sum(value for value, is_pinned in zip(scaled, pinned) if not is_pinned)
+        free_minutes = MINUTES_PER_DAY - floor * sum(pinned)
+        if free_total <= 0:
+            exact = [float(floor) if is_pinned else free_minutes / pinned.count(False)
+                     for is_pinned in pinned]
+            break
+        factor = free_minutes / free_total
+        exact = [float(floor) if is_pinned else value * factor
+                 for value, is_pinned in zip(scaled, pinned)]
+        newly_pinned = [i for i, value in enumerate(exact) if not pinned[i] and value < floor]
+        if not newly_pinned:
+            break
+        for i in newly_pinned:
+            pinned[i] = True
+
+    adjusted = [int(value) for value in exact]
+    leftover = MINUTES_PER_DAY - sum(adjusted)
+    by_remainder = sorted(range(len(exact)), key=lambda i: exact[i] - adjusted[i], reverse=True)
+    for i in by_remainder[:leftover]:
+        adjusted[i] += 1
+    return adjusted
+
+
+def build_area_schedule(base_slots: Sequence[Slot], status_config: EconomicStatus) -> List[Dict]:
+    """
+    Lay out an area's base slots with durations adjusted for an economic status.
+    The adjusted slots are contiguous and always cover exactly 24 hours.
+    """
+    adjusted_durations = rescale_durations(
+        [slot.duration for slot in base_slots],
+        [slot.power_on for slot in base_slots],
+        status_config.power_on_multiplier,
+        status_config.power_off_multiplier
+    )
+
+    # Lay the slots out back to back from the first slot's start time
+    adjusted_schedule = []
+    current_time_min = base_slots[0].start
+    for slot, duration in zip(base_slots, adjusted_durations):
+        end_time_min = (current_time_min + duration) % MINUTES_PER_DAY
+        adjusted_schedule.append({
+            "start": minutes_to_time(current_time_min),
+            "end": minutes_to_time(end_time_min),
+            "status": slot.status
+        })
+        current_time_min = end_time_min
+
+    return adjusted_schedule
+
+
 def generate_schedule_for_area(municipality: str, area: str, economic_status: str) -> List[Dict]:
     """
     Generate a schedule for a specific area based on economic status.
     Adjusts power-on and power-off durations according to economic conditions.
-    Maintains schedule continuity throughout the day.
+    The adjusted slots are contiguous and always cover exactly 24 hours.
     """
-    if municipality not in BASE_SCHEDULES or area not in BASE_SCHEDULES[municipality]:
+    base_slots = schedule_store.dataset.slots(municipality, area)
+    if not base_slots:
         return []
 
     if economic_status not in ECONOMIC_STATUSES:
         economic_status = "moderate"
 
-    status_config = ECONOMIC_STATUSES[economic_status]
-    base_schedule = BASE_SCHEDULES[municipality][area]
-    adjusted_schedule = []
+    return build_area_schedule(base_slots, ECONOMIC_STATUSES[economic_status])
 
-    # Start from the first slot's start time
-    current_time_min = time_to_minutes(base_schedule[0]["start"])
 
-    for slot in base_schedule:
-        start_time_str = slot["start"]
-        end_time_str = slot["end"]
-        status = slot["status"]
+def compile_schedules(economic_status: str) -> Dict[str, Dict[str, List[Dict]]]:
+    """Generate the schedules of every area for one economic status"""
+    schedules = {}
+    for municipality, area in schedule_store.dataset.scheduled_areas():
+        schedules.setdefault(municipality, {})[area] = generate_schedule_for_area(
+            municipality, area, economic_status
+        )
+    return schedules
+
 
-        # Calculate original duration
-        start_min = time_to_minutes(start_time_str)
-        end_min = time_to_minutes(end_time_str)
+# What-if Simulation
 
-        # Handle midnight crossover
-        if end_min < start_min:
-            end_min += 24 * 60
 
-        original_duration = end_min - start_min
+class SlotTable:
+    """
+    The base slots of every scheduled area flattened into parallel arrays
+    (NumPy arrays when available), so a set of multipliers can be applied to
+    every slot at once. Areas' slots are contiguous and in dataset order.
+    """
 
-        # Apply multiplier based on status
-        if status == "Power on":
-            multiplier = status_config.power_on_multiplier
+    def __init__(self, dataset: ScheduleDataset):
+        self.areas: List[Tuple[str, str]] = []
+        area_ids = []
+        durations = []
+        power_on = []
+        transitions = []
+        for municipality, area in dataset.scheduled_areas():
+            base_slots = dataset.slots(municipality, area)
+            if not base_slots:
+                continue
+            area_id = len(self.areas)
+            self.areas.append((municipality, area))
+            area_ids.extend([area_id] * len(base_slots))
+            durations.extend(slot.duration for slot in base_slots)
+            power_on.extend(slot.power_on for slot in base_slots)
+            # Slots are laid out back to back around the clock, so the status
+            # changes wherever neighbouring slots (cyclically) differ
+            transitions.append(sum(
+                base_slots[i].power_on != base_slots[i - 1].power_on for i in range(len(base_slots))))
+
+        self.transitions = transitions
+        slot_counts = [0] * len(self.areas)
+        for area_id in area_ids:
+            slot_counts[area_id] += 1
+        # First slot of each area, and the per-area floor used by rescale_durations
+        self.offsets = [0] * len(self.areas)
+        for area_id in range(1, len(self.areas)):
+            self.offsets[area_id] = self.offsets[area_id - 1] + slot_counts[area_id - 1]
+        floors = [min(MIN_SLOT_MINUTES, MINUTES_PER_DAY // count) for count in slot_counts]
+
+        if np is not None:
+            self.area_ids = np.asarray(area_ids, dtype=np.int64)
+            self.durations = np.asarray(durations, dtype=np.float64)
+            self.power_on = np.asarray(power_on, dtype=bool)
+            self.offsets = np.asarray(self.offsets, dtype=np.int64)
+            self.floors = np.asarray(floors, dtype=np.float64)
         else:
-            multiplier = status_config.power_off_multiplier
+            self.area_ids = area_ids
+            self.durations = durations
+            self.power_on = power_on
+            self.floors = floors
+
+    def daily_minutes(self, power_on_multiplier: float,
+                      power_off_multiplier: float) -> Tuple[List[int], List[int]]:
+        """(power-on minutes, power-off minutes) per area under a pair of multipliers"""
+        if np is not None:
+            adjusted = self._rescale_all(power_on_multiplier, power_off_multiplier)
+            on_minutes = np.bincount(self.area_ids, weights=adjusted * self.power_on, minlength=len(self.areas))
+            return on_minutes.astype(np.int64).tolist(), (MINUTES_PER_DAY - on_minutes).astype(np.int64).tolist()
+
+        on_minutes = []
+        for area_id, offset in enumerate(self.offsets):
+            end = self.offsets[area_id + 1] if area_id + 1 < len(self.offsets) else len(self.durations)
+            adjusted = rescale_durations(self.durations[offset:end], self.power_on[offset:end],
+                                         power_on_multiplier, power_off_multiplier)
+            on_minutes.append(sum(minutes for minutes, is_on in zip(adjusted, self.power_on[offset:end]) if is_on))
+        return on_minutes, [MINUTES_PER_DAY - minutes for minutes in on_minutes]
+
+    def _rescale_all(self, power_on_multiplier: float, power_off_multiplier: float):
+        """rescale_durations applied to every area at once; returns adjusted minutes per slot"""
+        area_ids = self.area_ids
+        area_count = len(self.areas)
+        scaled = self.durations * np.where(self.power_on, power_on_multiplier, power_off_multiplier)
+        floors = self.floors[area_ids]
+
+        # Pin slots under their area's floor and respread the rest, until no
+        # area has a free slot that is too short
+        pinned = np.zeros(len(scaled), dtype=bool)
+        while True:
+            free_total = np.bincount(area_ids, weights=np.where(pinned, 0.0, scaled), minlength=area_count)
+            free_minutes = MINUTES_PER_DAY - self.floors * np.bincount(area_ids, weights=pinned, minlength=area_count)
+            free_count = np.bincount(area_ids, weights=~pinned, minlength=area_count)
+            exhausted = (free_total <= 0)[area_ids]
+            # Areas with nothing left to scale share their free minutes evenly
+            with np.errstate(divide="ignore", invalid="ignore"):
+                factor = free_minutes / free_total
+                even_share = free_minutes / free_count
+                exact = np.where(pinned, floors,
+                                 np.where(exhausted, even_share[area_ids], scaled * factor[area_ids]))
+            newly_pinned = ~pinned & ~exhausted & (exact < floors)
+            if not newly_pinned.any():
+                break
+            pinned |= newly_pinned
+
+        # Hand rounding leftovers to the largest fractional parts, earlier
+        # slots first on ties
+        adjusted = np.trunc(exact)
+        remainders = exact - adjusted
+        leftover = MINUTES_PER_DAY - np.bincount(area_ids, weights=adjusted, minlength=area_count)
+        order = np.lexsort((np.arange(len(exact)), -remainders, area_ids))
+        rank = np.empty(len(exact), dtype=np.int64)
+        rank[order] = np.arange(len(exact)) - self.offsets[area_ids[order]]
+        return adjusted + (rank < np.rint(leftover)[area_ids])
+
+
+def simulate(table: SlotTable, scenarios: Dict[str, EconomicStatus]) -> Dict:
+    """
+    Daily power-on/off minutes and status transitions per area, per
+    municipality and overall for each scenario, without touching the active
+    schedules
+    """
+    results = {}
+    for name, status_config in scenarios.items():
+        on_minutes, off_minutes = table.daily_minutes(
+            status_config.power_on_multiplier, status_config.power_off_multiplier)
+        areas: Dict[str, Dict[str, Dict]] = {}
+        municipalities: Dict[str, Dict] = {}
+        totals = {"areas": 0, "on_minutes": 0, "off_minutes": 0, "transitions": 0}
+        for (municipality, area), on, off, transitions in zip(
+                table.areas, on_minutes, off_minutes, table.transitions):
+            areas.setdefault(municipality, {})[area] = {
+                "on_minutes": on, "off_minutes": off, "transitions": transitions}
+            summary = municipalities.setdefault(
+                municipality, {"areas": 0, "on_minutes": 0, "off_minutes": 0, "transitions": 0})
+            for summed in (summary, totals):
+                summed["areas"] += 1
+                summed["on_minutes"] += on
+                summed["off_minutes"] += off
+                summed["transitions"] += transitions
+        for summed in (*municipalities.values(), totals):
+            summed["on_share"] = round(summed["on_minutes"] / (summed["areas"] * MINUTES_PER_DAY), 4) \
+                if summed["areas"] else None
+        results[name] = {
+            "power_on_multiplier": status_config.power_on_multiplier,
+            "power_off_multiplier": status_config.power_off_multiplier,
+            "totals": totals,
+            "municipalities": municipalities,
+            "areas": areas
+        }
+    return results
+
+
+# Interval Index
+
+
+class IntervalIndex:
+    """
+    Compiled minute-of-day view of one area's schedule.
+    `boundaries` holds the sorted start minute of each run of equal status
+    (always beginning at 0) and `statuses` the status of that run, so a lookup
+    is a single bisect with no string parsing. Slots crossing midnight are split
+    in two, and where slots overlap the earlier slot wins, exactly like the
+    linear scan over the schedule.
+    """
 
-        # Calculate new duration
-        new_duration = int(original_duration * multiplier)
+    __slots__ = ("boundaries", "statuses", "change_points")
+
+    def __init__(self, boundaries: List[int], statuses: List[str]):
+        self.boundaries = boundaries
+        self.statuses = statuses
+        # Boundaries where the status actually differs from the minute before,
+        # treating the day as a cycle (midnight is only a change if the status
+        # before and after it differs)
+        self.change_points = [
+            boundary for position, boundary in enumerate(boundaries)
+            if statuses[position] != statuses[position - 1]
+        ]
+
+    @classmethod
+    def from_schedule(cls, schedule: List[Dict]) -> "IntervalIndex":
+        """Compile a list of HH:MM slots into an interval index"""
+        spans = []
+        for slot in schedule:
+            start_min = time_to_minutes(slot["start"])
+            end_min = time_to_minutes(slot["end"])
+            if start_min >= end_min:  # crosses midnight (or spans the whole day)
+                spans.append((start_min, MINUTES_PER_DAY, slot["status"]))
+                spans.append((0, end_min, slot["status"]))
+            else:
+                spans.append((start_min, end_min, slot["status"]))
+
+        # The status can only change where a span starts or ends
+        points = sorted({0}.union(*((start, end) for start, end, _ in spans)) - {MINUTES_PER_DAY})
+        boundaries = []
+        statuses = []
+        for point in points:
+            status = next(
+                (status for start, end, status in spans if start <= point < end), "Unknown")
+            if not statuses or status != statuses[-1]:
+                boundaries.append(point)
+                statuses.append(status)
+        return cls(boundaries, statuses)
+
+    def status_at(self, minute: int) -> str:
+        """Status at a minute of the day (0-1439)"""
+        return self.statuses[bisect.bisect_right(self.boundaries, minute) - 1]
+
+    def current_run_start(self, minute: int) -> Optional[int]:
+        """
+        Minute at which the status in effect at the given minute of the day
+        began (negative if it began the previous day), or None if the status
+        never changes.
+        """
+        if not self.change_points:
+            return None
+        position = bisect.bisect_right(self.change_points, minute) - 1
+        if position >= 0:
+            return self.change_points[position]
+        return self.change_points[-1] - MINUTES_PER_DAY
+
+    def next_change(self, minute: int) -> Optional[int]:
+        """
+        Minute (counted from the same midnight, so possibly >= 1440) at which the
+        status next changes after the given minute of the day, or None if the
+        status never changes.
+        """
+        if not self.change_points:
+            return None
+        position = bisect.bisect_right(self.change_points, minute)
+        if position < len(self.change_points):
+            return self.change_points[position]
+        return self.change_points[0] + MINUTES_PER_DAY
+
+
+# Status codes used by packed (array based) indexes
+STATUS_NAMES = ("Unknown", "Power on", "Power off")
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+
+
+class PackedIndex:
+    """
+    Interval indexes of every area packed into one flat sorted key array.
+    Each boundary is stored as `area_position * 1440 + minute`, so a single
+    searchsorted (or bisect without NumPy) resolves any number of
+    area x minute queries at once.
+    """
+
+    def __init__(self, indexes: Dict[str, Dict[str, IntervalIndex]]):
+        self.areas: List[Tuple[str, str]] = []
+        self.positions: Dict[Tuple[str, str], int] = {}
+        keys = []
+        codes = []
+        for municipality, areas in indexes.items():
+            for area, area_index in areas.items():
+                position = len(self.areas)
+                self.areas.append((municipality, area))
+                self.positions[(municipality, area)] = position
+                for boundary, status in zip(area_index.boundaries, area_index.statuses):
+                    keys.append(position * MINUTES_PER_DAY + boundary)
+                    codes.append(STATUS_CODES[status])
+
+        if np is not None:
+            self.keys = np.asarray(keys, dtype=np.int64)
+            self.codes = np.asarray(codes, dtype=np.int8)
+        else:
+            self.keys = keys
+            self.codes = codes
+
+    @classmethod
+    def from_arrays(cls, areas: List[Tuple[str, str]], positions: Dict[Tuple[str, str], int],
+                    keys: Sequence[int], codes: Sequence[int]) -> "PackedIndex":
+        """A packed index over prebuilt key and code buffers (such as a mapped snapshot), without copying them"""
+        packed = cls.__new__(cls)
+        packed.areas = areas
+        packed.positions = positions
+        if np is not None:
+            packed.keys = np.frombuffer(keys, dtype=np.int64)
+            packed.codes = np.frombuffer(codes, dtype=np.int8)
+        else:
+            packed.keys = keys
+            packed.codes = codes
+        return packed
+
+    def change_points(self) -> Dict[int, List[int]]:
+        """
+        Minute of the day -> positions of the areas whose status changes at
+        it, read off the key and code arrays (the day is a cycle, as in
+        IntervalIndex.change_points)
+        """
+        keys = self.keys.tolist() if np is not None else list(self.keys)
+        codes = self.codes.tolist() if np is not None else list(self.codes)
+        changes: Dict[int, List[int]] = {}
+        start = 0
+        while start < len(keys):
+            position = keys[start] // MINUTES_PER_DAY
+            end = start + 1
+            while end < len(keys) and keys[end] // MINUTES_PER_DAY == position:
+                end += 1
+            for entry in range(start, end):
+                # An area's first boundary is compared with its last
+                if codes[entry] != codes[entry - 1 if entry > start else end - 1]:
+                    changes.setdefault(keys[entry] - position * MINUTES_PER_DAY, []).append(position)
+            start = end
+        return changes
+
+    def lookup(self, positions: Sequence[int], minutes: Sequence[int]) -> List[List[int]]:
+        """Status codes as a matrix of areas (rows) by minutes of the day (columns)"""
+        if np is not None:
+            queries = (np.asarray(positions, dtype=np.int64)[:, None] * MINUTES_PER_DAY
+                       + np.asarray(minutes, dtype=np.int64)[None, :])
+            found = np.searchsorted(self.keys, queries, side="right") - 1
+            return self.codes[found].tolist()
+
+        return [
+            [self.codes[bisect.bisect_right(self.keys, position * MINUTES_PER_DAY + minute) - 1]
+             for minute in minutes]
+            for position in positions
+        ]
+
+    def statuses_at(self, positions: Sequence[int], minute: int) -> List[str]:
+        """Status of each area position at one minute of the day"""
+        return [STATUS_NAMES[row[0]] for row in self.lookup(positions, [minute])]
+
+
+# Compiled Schedule Store
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time: callers asking for a key that
+    is already being built wait for that build and share its result (or
+    exception) instead of repeating the work.
+    """
 
-        # Ensure minimum duration of 30 minutes
-        if new_duration < 30:
-            new_duration = 30
+    def __init__(self, name: str):
+        self._waits = SINGLE_FLIGHT_WAITS.labels(name)
+        self._lock = threading.Lock()
+        self._flights: Dict = {}
+
+    def do(self, key, build):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._waits.inc()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = build()
+            return flight.result
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+def dumps_json(value) -> bytes:
+    """Encode a value as compact JSON bytes (with orjson when it is installed)"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+class CompiledArea(NamedTuple):
+    """Everything compiled for one area under one economic status"""
+    schedule: List[Dict]
+    index: IntervalIndex
+    schedule_json: bytes  # The schedule pre-encoded for API responses
+
+
+class CompiledSchedules:
+    """
+    Schedules and interval indexes of every area for one economic status and
+    one dataset version. Each area is compiled the first time it is requested
+    and memoized; the all-area views are assembled once on first use.
+    Concurrent first requests share one compilation (see SingleFlight).
+
+    With a `snapshot` of the same dataset, areas are decoded from the
+    snapshot instead of generated, and the packed index is a view of the
+    snapshot's arrays.
+    """
 
-        # Calculate new end time
-        new_end_min = (current_time_min + new_duration) % (24 * 60)
+    def __init__(self, dataset: ScheduleDataset, economic_status: str,
+                 snapshot: Optional[CompiledSnapshot] = None):
+        self.dataset = dataset
+        self.economic_status = economic_status
+        self.snapshot = snapshot
+        self._snapshot_status = snapshot.statuses[economic_status] if snapshot is not None else None
+        self._areas: Dict[Tuple[str, str], Optional[CompiledArea]] = {}
+        self._schedules: Optional[Dict[str, Dict[str, List[Dict]]]] = None
+        self._indexes: Optional[Dict[str, Dict[str, IntervalIndex]]] = None
+        self._packed: Optional[PackedIndex] = None
+        self._flight = SingleFlight("compiled_schedules")
+
+    def area(self, municipality: str, area: str) -> Optional[CompiledArea]:
+        """Compiled schedule of one area, or None if it has no schedule"""
+        key = (municipality, area)
+        if key in self._areas:
+            COMPILED_AREA_HIT.inc()
+            return self._areas[key]
+        return self._flight.do(key, lambda: self._compile_area(key))
+
+    def _compile_area(self, key: Tuple[str, str]) -> Optional[CompiledArea]:
+        if key in self._areas:
+            # Compiled by a call that finished after our first look
+            COMPILED_AREA_HIT.inc()
+            return self._areas[key]
+
+        COMPILED_AREA_MISS.inc()
+        municipality, area = key
+        if self._snapshot_status is not None:
+            compiled = self._from_snapshot(municipality, area)
+            self._areas[key] = compiled
+            return compiled
+
+        base_slots = self.dataset.slots(municipality, area)
+        compiled = None
+        if base_slots:
+            started = time.perf_counter()
+            schedule = build_area_schedule(base_slots, ECONOMIC_STATUSES[self.economic_status])
+            generated = time.perf_counter()
+            area_index = IntervalIndex.from_schedule(schedule)
+            PHASE_LATENCY.labels("generate").observe(generated - started)
+            PHASE_LATENCY.labels("index").observe(time.perf_counter() - generated)
+            SCHEDULE_REGENERATIONS.labels(self.economic_status).inc()
+            compiled = CompiledArea(schedule, area_index, dumps_json(schedule))
+        self._areas[key] = compiled
+        return compiled
+
+    def _from_snapshot(self, municipality: str, area: str) -> Optional[CompiledArea]:
+        position = self.snapshot.position(municipality, area)
+        if position is None:
+            return None
+        boundaries, codes, schedule_json = self._snapshot_status.area(position)
+        area_index = IntervalIndex(boundaries, [STATUS_NAMES[code] for code in codes])
+        return CompiledArea(json.loads(schedule_json), area_index, schedule_json)
+
+    def _once(self, attribute: str, build):
+        """A memoized view, built by only one of any concurrent first callers"""
+        def build_once():
+            value = getattr(self, attribute)
+            if value is None:
+                value = build()
+                setattr(self, attribute, value)
+            return value
+
+        value = getattr(self, attribute)
+        return value if value is not None else self._flight.do(attribute, build_once)
+
+    def _by_municipality(self, field: str) -> Dict[str, Dict]:
+        """One field of every compiled area, by municipality and area"""
+        view = {}
+        for municipality, area in self.dataset.scheduled_areas():
+            compiled = self.area(municipality, area)
+            if compiled:
+                view.setdefault(municipality, {})[area] = getattr(compiled, field)
+        return view
+
+    def _build_packed(self) -> PackedIndex:
+        if self._snapshot_status is not None:
+            return PackedIndex.from_arrays(self.snapshot.areas, self.snapshot.positions,
+                                           self._snapshot_status.keys, self._snapshot_status.codes)
+        return PackedIndex(self.indexes)
+
+    @property
+    def schedules(self) -> Dict[str, Dict[str, List[Dict]]]:
+        return self._once("_schedules", lambda: self._by_municipality("schedule"))
+
+    @property
+    def indexes(self) -> Dict[str, Dict[str, IntervalIndex]]:
+        return self._once("_indexes", lambda: self._by_municipality("index"))
+
+    @property
+    def packed(self) -> PackedIndex:
+        return self._once("_packed", self._build_packed)
+
+    def packed_if_ready(self) -> Optional[PackedIndex]:
+        """
+        The packed index if it costs no per-area compiling or decoding (it
+        was built already, or is a view of the snapshot's arrays), else None
+        """
+        if self._packed is None and self._snapshot_status is None:
+            return None
+        return self.packed
+
+    def warm(self) -> None:
+        """Compile every area and the all-area views up front"""
+        self.schedules
+        self.packed
+
+
+def compiled_fingerprint(dataset: ScheduleDataset) -> str:
+    """Identifies everything compiled schedules depend on: the dataset, the statuses and the compiler"""
+    statuses = sorted(
+        (key, status.power_on_multiplier, status.power_off_multiplier)
+        for key, status in ECONOMIC_STATUSES.items()
+    )
+    source = [dataset.fingerprint(), statuses, MIN_SLOT_MINUTES, SNAPSHOT_FORMAT]
+    return hashlib.sha256(json.dumps(source).encode()).hexdigest()
+
+
+def build_snapshot_file(path: str, dataset: ScheduleDataset) -> int:
+    """Compile every area under every economic status into a snapshot file; returns the area count"""
+    compiled = {status_key: CompiledSchedules(dataset, status_key) for status_key in ECONOMIC_STATUSES}
+    areas = [key for key in dataset.scheduled_areas() if compiled["moderate"].area(*key) is not None]
+    statuses = {}
+    for status_key, status_compiled in compiled.items():
+        statuses[status_key] = []
+        for key in areas:
+            compiled_area = status_compiled.area(*key)
+            codes = [STATUS_CODES[status] for status in compiled_area.index.statuses]
+            statuses[status_key].append((compiled_area.index.boundaries, codes, compiled_area.schedule_json))
+    write_snapshot(path, compiled_fingerprint(dataset), areas, statuses)
+    return len(areas)
+
+
+@dataclass(frozen=True)
+class ScheduleGeneration:
+    """Immutable set of compiled schedules that is active for one economic status"""
+    status: str
+    generation: int  # Incremented every time the economic status changes
+    compiled: CompiledSchedules
+    dataset_version: int  # Changes whenever the dataset is reloaded
+    changed_at: float  # UNIX time the status, the dataset or the overrides last changed
+    overrides: OverrideSet  # Override events layered on the schedules
+
+    @property
+    def tag(self) -> str:
+        """Identifies the schedules of this generation across all workers"""
+        return f"{self.generation}.{self.dataset_version}.{self.overrides.revision}"
+
+    @property
+    def schedules(self) -> Dict[str, Dict[str, List[Dict]]]:
+        return self.compiled.schedules
+
+    @property
+    def indexes(self) -> Dict[str, Dict[str, IntervalIndex]]:
+        return self.compiled.indexes
+
+    @property
+    def packed(self) -> PackedIndex:
+        return self.compiled.packed
+
+    def schedule(self, municipality: str, area: str) -> Optional[List[Dict]]:
+        """Schedule of one area, or None if the area has no schedule"""
+        compiled = self.compiled.area(municipality, area)
+        return compiled.schedule if compiled else None
+
+    def index(self, municipality: str, area: str) -> Optional[IntervalIndex]:
+        """Interval index of one area, or None if the area has no schedule"""
+        compiled = self.compiled.area(municipality, area)
+        return compiled.index if compiled else None
+
+    def area(self, municipality: str, area: str) -> Optional[CompiledArea]:
+        """Everything compiled for one area, or None if the area has no schedule"""
+        return self.compiled.area(municipality, area)
+
+
+class ScheduleStore:
+    """
+    Compiles the schedules of every area for every economic status, and swaps
+    the active set atomically when the economic status changes.
+    Readers only ever dereference the active generation; nothing is regenerated
+    per request. With `preload` every area is compiled up front, otherwise
+    areas are compiled (and loaded from the dataset) on first request.
+
+    The economic status itself lives in `status_state`, which can be shared by
+    several worker processes; `refresh()` compares its generation with the one
+    this process last saw and switches schedules when another worker changed it.
+
+    `names` indexes the dataset's municipality and area names for lookups
+    that tolerate case, accents, spacing and typos; it is rebuilt whenever the
+    dataset reloads.
+
+    Override events come from `override_store`. Each generation carries the
+    override timelines of its time; when the events change (here or in
+    another worker) only the timelines of the areas they touch are rebuilt.
+
+    A `snapshot` built from the same dataset replaces compiling altogether:
+    areas are decoded from it on first request and the packed indexes are
+    views of its mapped arrays. One built from anything else is ignored.
+    """
 
-        # Create adjusted slot
-        adjusted_schedule.append({
-            "start": minutes_to_time(current_time_min),
-            "end": minutes_to_time(new_end_min),
-            "status": status
-        })
+    def __init__(self, dataset: ScheduleDataset, status_state, override_store, preload: bool = True,
+                 snapshot: Optional[CompiledSnapshot] = None):
+        self.dataset = dataset
+        self.status_state = status_state
+        self.override_store = override_store
+        self.preload = preload
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._compiled = self._compile_all()
+        self._area_lists: Dict[str, bytes] = {}
+        self._slot_table: Optional[SlotTable] = None
+        self.names = AreaNameIndex(dataset.municipalities())
+        self._overrides_lock = threading.Lock()
+        self._overrides = self._all_overrides()
+        self._overrides_changed_at = 0.0
+        self._synced = None
+        self._sync(*status_state.read())
+
+    def _compile_all(self) -> Dict[str, CompiledSchedules]:
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.fingerprint != compiled_fingerprint(self.dataset):
+            app.logger.warning("Ignoring snapshot %s: built from another dataset or status definitions",
+                               snapshot.path)
+            snapshot = None
+        compiled = {
+            status_key: CompiledSchedules(self.dataset, status_key, snapshot) for status_key in ECONOMIC_STATUSES
+        }
+        if snapshot is not None:
+            # Nothing to generate; areas are decoded on first request
+            return compiled
+        if self.preload:
+            for status_compiled in compiled.values():
+                status_compiled.warm()
+        return compiled
+
+    def _all_overrides(self) -> OverrideSet:
+        """Every override event that has not ended, with each area's timeline built afresh"""
+        areas_by_municipality: Dict[str, List[str]] = {}
+        for municipality, area in self.dataset.scheduled_areas():
+            areas_by_municipality.setdefault(municipality, []).append(area)
+        now = clock.now().timestamp()
+        revision, events = self.override_store.events(now)
+        overrides = OverrideSet(areas_by_municipality).updated(revision, events, now)
+        OVERRIDE_TIMELINE_BUILDS.inc(overrides.rebuilt)
+        return overrides
+
+    def _sync(self, status_generation: int, economic_status: str, changed_at: float,
+              rebuild: bool = False) -> ScheduleGeneration:
+        with self._lock:
+            state = (status_generation, economic_status, changed_at)
+            if rebuild or self._synced != state:
+                self._active = ScheduleGeneration(
+                    economic_status if economic_status in self._compiled else "moderate",
+                    status_generation,
+                    self._compiled.get(economic_status, self._compiled["moderate"]),
+                    self.dataset.version,
+                    max(changed_at, self.dataset.modified_at, self._overrides_changed_at),
+                    self._overrides
+                )
+                self._synced = state
+                SCHEDULE_ACTIVATIONS.inc()
+            return self._active
+
+    @property
+    def active(self) -> ScheduleGeneration:
+        """The currently active generation (a single atomic reference read)"""
+        return self._active
+
+    def area_list_json(self, municipality: str) -> bytes:
+        """A municipality's area names, pre-encoded as a JSON array (empty if it is unknown)"""
+        municipality = self.names.municipality(municipality)
+        if municipality is None:
+            return b"[]"
+        area_lists = self._area_lists
+        if municipality not in area_lists:
+            area_lists[municipality] = dumps_json(self.dataset.area_names(municipality))
+        return area_lists[municipality]
+
+    @property
+    def slot_table(self) -> SlotTable:
+        """Base slots of every area flattened for simulations, built on first use"""
+        table = self._slot_table
+        if table is None:
+            table = self._slot_table = SlotTable(self.dataset)
+        return table
+
+    def activate(self, economic_status: str) -> ScheduleGeneration:
+        """Make the precompiled schedules for an economic status the active set"""
+        return self._sync(*self.status_state.publish(economic_status))
+
+    def reload_overrides(self) -> ScheduleGeneration:
+        """
+        Activate the override events any worker changed since the active
+        revision, rebuilding only the timelines of the areas they touch
+        """
+        with self._overrides_lock:
+            revision, changed = self.override_store.changes(self._overrides.revision)
+            overrides = self._overrides.updated(revision, changed, clock.now().timestamp())
+            OVERRIDE_TIMELINE_BUILDS.inc(overrides.rebuilt)
+            with self._lock:
+                self._overrides = overrides
+                self._overrides_changed_at = time.time()
+        return self._sync(*self.status_state.read(), rebuild=True)
+
+    def refresh(self) -> ScheduleGeneration:
+        """Follow economic status and override changes from other workers and dataset changes on disk"""
+        dataset_changed = self.dataset.reload_if_changed()
+        if dataset_changed:
+            compiled = self._compile_all()
+            names = AreaNameIndex(self.dataset.municipalities())
+            # Municipality-wide events follow the dataset's areas
+            with self._overrides_lock:
+                overrides = self._all_overrides()
+                with self._lock:
+                    self._compiled = compiled
+                    self._area_lists = {}
+                    self._slot_table = None
+                    self.names = names
+                    self._overrides = overrides
+        elif self.override_store.changed_since(self._overrides.revision):
+            return self.reload_overrides()
+        state = self.status_state.read()
+        if dataset_changed or state != self._synced:
+            return self._sync(*state, rebuild=dataset_changed)
+        return self._active
+
+
+def open_snapshot() -> Optional[CompiledSnapshot]:
+    """The snapshot named by SCHEDULE_SNAPSHOT; a missing or unreadable one only costs a compile"""
+    try:
+        return load_snapshot()
+    except (OSError, ValueError) as error:
+        app.logger.warning("Compiling schedules without a snapshot: %s", error)
+        return None
+
+
+schedule_store = ScheduleStore(
+    load_dataset(os.environ.get("SCHEDULE_DATASET"), MUNICIPALITIES, BASE_SCHEDULES),
+    load_status_state(os.environ.get("SCHEDULE_STATE_FILE"), current_economic_status),
+    load_override_store(),
+    preload=not os.environ.get("SCHEDULE_DATASET"),
+    snapshot=open_snapshot()
+)
 
-        # Move to next slot start (which is the end of current slot)
-        current_time_min = new_end_min
 
-    # Ensure the last slot wraps properly to the first slot's start
-    if adjusted_schedule:
-        first_start_min = time_to_minutes(adjusted_schedule[0]["start"])
-        last_end_min = time_to_minutes(adjusted_schedule[-1]["end"])
+def get_current_schedules() -> Dict:
+    """Get all current schedules based on economic status"""
+    return schedule_store.active.schedules
 
-        # If last end is before first start (or equal), it's already correct
-        # If last end is after first start, we need to wrap it
-        if last_end_min > first_start_min:
-            # The last slot should end at the first slot's start (wrapping)
-            # But we need to handle this in the status check logic instead
-            pass
 
-    return adjusted_schedule
+def resolve_area(municipality, area) -> Tuple:
+    """
+    The dataset's spelling of a requested municipality and area, so
+    "kilamba city" or "Zango1" find their area. Names that match nothing
+    are returned as given.
+    """
+    if not isinstance(municipality, str) or not isinstance(area, str):
+        return municipality, area
+    return schedule_store.names.area(municipality, area) or (municipality, area)
 
 
-def get_current_schedules() -> Dict:
-    """Get all current schedules based on economic status"""
-    schedules = {}
-    for municipality in BASE_SCHEDULES:
-        schedules[municipality] = {}
-        for area in BASE_SCHEDULES[municipality]:
-            schedules[municipality][area] = generate_schedule_for_area(
-                municipality, area, current_economic_status
-            )
-    return schedules
+def resolve_municipality(municipality: str) -> str:
+    """The dataset's spelling of a requested municipality, or the name as given"""
+    return schedule_store.names.municipality(municipality) or municipality
 
 
 # Power Status Logic
@@ -444,169 +1305,1274 @@ def get_current_schedules() -> Dict:
 
 def get_current_power_status(municipality: str, area: str) -> str:
     """Get current power status for a specific area"""
-    schedules = get_current_schedules()
+    active = schedule_store.active
+    area_index = active.index(municipality, area)
 
-    if municipality not in schedules or area not in schedules[municipality]:
+    if area_index is None:
         return "Unknown"
 
-    current_time = datetime.datetime.now().time()
-    area_schedule = schedules[municipality][area]
+    return current_area_status(active, municipality, area, area_index, clock.now())
 
-    for slot in area_schedule:
-        start_time = datetime.datetime.strptime(slot["start"], "%H:%M").time()
-        end_time = datetime.datetime.strptime(slot["end"], "%H:%M").time()
 
-        # Handle time ranges that cross midnight
-        if start_time > end_time:  # crosses midnight
-            if current_time >= start_time or current_time < end_time:
-                return slot["status"]
-        else:  # normal time range
-            if start_time <= current_time < end_time:
-                return slot["status"]
+def get_power_status_at(municipality: str, area: str, moment: datetime.datetime) -> str:
+    """Get the power status of an area at any moment"""
+    active = schedule_store.active
+    area_index = active.index(municipality, area)
 
-    return "Unknown"
+    if area_index is None:
+        return "Unknown"
 
+    return area_status_at(active, municipality, area, area_index, moment)
 
-# Flask Routes
 
+def get_next_power_change(municipality: str, area: str,
+                          moment: datetime.datetime) -> Optional[datetime.datetime]:
+    """Get the moment an area's power status next changes after a given moment"""
+    active = schedule_store.active
+    area_index = active.index(municipality, area)
+
+    if area_index is None:
+        return None
+
+    return area_next_change(active, municipality, area, area_index, moment)
+
+
+def schedule_change_after(area_index: IntervalIndex,
+                          moment: datetime.datetime) -> Optional[datetime.datetime]:
+    """The moment an area's schedule (ignoring overrides) next changes status, or None"""
+    next_minute = area_index.next_change(minute_of_day(moment))
+    if next_minute is None:
+        return None
+
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + datetime.timedelta(minutes=next_minute)
+
+
+def area_status_at(active: ScheduleGeneration, municipality: str, area: str,
+                   area_index: IntervalIndex, moment: datetime.datetime) -> str:
+    """An area's status at a moment: the override in effect if there is one, else its schedule"""
+    override = active.overrides.status_at(municipality, area, moment.timestamp())
+    if override is not None:
+        return override
+    return area_index.status_at(minute_of_day(moment))
+
+
+def current_area_status(active: ScheduleGeneration, municipality: str, area: str,
+                        area_index: IntervalIndex, moment: datetime.datetime) -> str:
+    """
+    An area's status at a moment the transition timer's snapshot covers (such
+    as now), read from the snapshot; falls back to area_status_at otherwise
+    """
+    status = transition_scheduler.status(municipality, area, moment, active)
+    if status is None:
+        SNAPSHOT_MISS.inc()
+        return area_status_at(active, municipality, area, area_index, moment)
+    SNAPSHOT_HIT.inc()
+    return status
+
+
+def area_next_change(active: ScheduleGeneration, municipality: str, area: str,
+                     area_index: IntervalIndex, moment: datetime.datetime) -> Optional[datetime.datetime]:
+    """
+    The moment an area's status next changes after a moment, overrides
+    included, or None if it never does. Schedule changes an override hides
+    and override boundaries that leave the status as it was are skipped.
+    """
+    timeline = active.overrides.timeline(municipality, area)
+    if timeline is None:
+        return schedule_change_after(area_index, moment)
+
+    status = area_status_at(active, municipality, area, area_index, moment)
+    while True:
+        _, override, segment_end = timeline.segment(moment.timestamp())
+        candidates = []
+        if segment_end is not None:
+            candidates.append(datetime.datetime.fromtimestamp(segment_end, moment.tzinfo))
+        if override is None:
+            schedule_change = schedule_change_after(area_index, moment)
+            if schedule_change is not None:
+                candidates.append(schedule_change)
+        if not candidates:
+            return None
+        moment = min(candidates)
+        if area_status_at(active, municipality, area, area_index, moment) != status:
+            return moment
+
+
+def override_run_start(active: ScheduleGeneration, municipality: str, area: str,
+                       moment: datetime.datetime) -> Optional[float]:
+    """Start (UNIX time) of the override segment holding a moment, or None outside every override"""
+    timeline = active.overrides.timeline(municipality, area)
+    if timeline is None:
+        return None
+    start, override, _ = timeline.segment(moment.timestamp())
+    return start if override is not None else None
+
+
+# Timeline Expansion
+
+
+def expand_timeline(area_index: IntervalIndex, start: datetime.datetime,
+                    end: datetime.datetime) -> Iterator[Tuple[datetime.datetime, datetime.datetime, str]]:
+    """
+    Lazily expand an area's daily cycle into dated (start, end, status)
+    intervals covering [start, end). Runs of the same status are merged
+    across midnight, so every yielded interval is a real on/off period.
+    """
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    pending = None
+
+    while day < end:
+        boundaries = area_index.boundaries
+        for position, status in enumerate(area_index.statuses):
+            run_start = day + datetime.timedelta(minutes=boundaries[position])
+            run_end_minute = boundaries[position + 1] if position + 1 < len(boundaries) else MINUTES_PER_DAY
+            run_end = day + datetime.timedelta(minutes=run_end_minute)
+
+            run_start = max(run_start, start)
+            run_end = min(run_end, end)
+            if run_start >= run_end:
+                continue
+
+            if pending and pending[2] == status and pending[1] == run_start:
+                pending = (pending[0], run_end, status)
+            else:
+                if pending:
+                    yield pending
+                pending = (run_start, run_end, status)
+        day += datetime.timedelta(days=1)
+
+    if pending:
+        yield pending
+
+
+def overlay_overrides(intervals: Iterator[Tuple[datetime.datetime, datetime.datetime, str]],
+                      timeline: Optional[OverrideTimeline]
+                      ) -> Iterator[Tuple[datetime.datetime, datetime.datetime, str]]:
+    """
+    Dated intervals with an area's overrides laid over them. Intervals are
+    split where an override starts or ends and neighbours of the same status
+    are merged again.
+    """
+    if timeline is None:
+        yield from intervals
+        return
+
+    pending = None
+    for start, end, status in intervals:
+        piece_start = start
+        while piece_start < end:
+            _, override, segment_end = timeline.segment(piece_start.timestamp())
+            piece_end = end
+            if segment_end is not None:
+                piece_end = min(end, datetime.datetime.fromtimestamp(segment_end, start.tzinfo))
+            piece_status = override if override is not None else status
+
+            if pending and pending[2] == piece_status and pending[1] == piece_start:
+                pending = (pending[0], piece_end, piece_status)
+            else:
+                if pending:
+                    yield pending
+                pending = (piece_start, piece_end, piece_status)
+            piece_start = piece_end
+
+    if pending:
+        yield pending
+
+
+# Outage Statistics
+
+outage_stats = OutageStats(dumps_json)
+
+
+# Transition Scheduler
+
+transition_scheduler = TransitionScheduler(lambda: schedule_store.refresh(), lambda: clock, app.logger)
+
+
+# Push Notifications
+
+# Seconds between keep-alive comments on idle event streams
+SSE_KEEPALIVE_SECONDS = 25
+
+
+def format_sse(event: str, data: Dict) -> bytes:
+    """Encode one Server-Sent Events message"""
+    return b"event: " + event.encode() + b"\ndata: " + dumps_json(data) + b"\n\n"
+
+
+def area_status_event(active: ScheduleGeneration, municipality: str, area: str,
+                      moment: datetime.datetime) -> bytes:
+    """'status' event describing an area's status at a moment"""
+    area_index = active.index(municipality, area)
+    next_change = area_next_change(active, municipality, area, area_index, moment)
+    return format_sse("status", {
+        "municipality": municipality,
+        "area": area,
+        "status": current_area_status(active, municipality, area, area_index, moment),
+        "at": moment.replace(second=0, microsecond=0).isoformat(),
+        "next_change": next_change.isoformat() if next_change else None,
+        "generation": active.generation
+    })
+
+
+def snapshot_event(active: ScheduleGeneration, moment: datetime.datetime) -> bytes:
+    """'snapshot' event holding the status of every area"""
+    packed = active.packed
+    statuses = {}
+    snapshot = transition_scheduler.current(moment, active)
+    if snapshot is not None:
+        SNAPSHOT_HIT.inc()
+        for municipality, area in packed.areas:
+            statuses.setdefault(municipality, {})[area] = snapshot.statuses.get((municipality, area), "Unknown")
+    else:
+        SNAPSHOT_MISS.inc()
+        codes = packed.lookup(range(len(packed.areas)), [minute_of_day(moment)])
+        for (municipality, area), row in zip(packed.areas, codes):
+            statuses.setdefault(municipality, {})[area] = STATUS_NAMES[row[0]]
+        for (municipality, area), status in active.overrides.statuses_at(moment.timestamp()).items():
+            if (municipality, area) in packed.positions:
+                statuses[municipality][area] = status
+    return format_sse("snapshot", {
+        "at": moment.replace(second=0, microsecond=0).isoformat(),
+        "economic_status": active.status,
+        "generation": active.generation,
+        "statuses": statuses
+    })
+
+
+transition_hub = TransitionHub(transition_scheduler, area_status_event, snapshot_event)
+transition_scheduler.add_listener(transition_hub)
+
+
+# HTTP Caching
+
+# max-age (seconds) for responses that only change when the dataset does, and
+# for schedules whose status never changes
+STATIC_MAX_AGE = 300
+
+
+def utc_from_timestamp(timestamp: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def validators_match(if_none_match: Optional[ETags], if_modified_since: Optional[datetime.datetime],
+                     etag: str, last_modified: datetime.datetime) -> bool:
+    """Whether a request's parsed validators show the client already has this representation"""
+    if if_none_match:
+        not_modified = if_none_match.contains_weak(etag)
+    elif if_modified_since:
+        not_modified = last_modified.replace(microsecond=0) <= if_modified_since
+    else:
+        not_modified = False
+    (HTTP_CACHE_HIT if not_modified else HTTP_CACHE_MISS).inc()
+    return not_modified
+
+
+def is_not_modified(etag: str, last_modified: datetime.datetime) -> bool:
+    """Whether the current request's validators match this representation"""
+    return validators_match(request.if_none_match, request.if_modified_since, etag, last_modified)
+
+
+def cache_headers(etag: str, last_modified: datetime.datetime, max_age: float,
+                  weak: bool = False) -> Dict[str, str]:
+    """Validators and a public max-age so clients and proxies can cache"""
+    return {
+        "ETag": quote_etag(etag, weak),
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": f"public, max-age={max(0, int(max_age))}"
+    }
+
+
+def with_cache_headers(response: Response, etag: str, last_modified: datetime.datetime,
+                       max_age: float, weak: bool = False) -> Response:
+    """Attach cache_headers() to a Flask response"""
+    response.headers.update(cache_headers(etag, last_modified, max_age, weak))
+    return response
 
-@app.route('/')
-def index():
-    """Main page displaying power schedule interface"""
-    schedules = get_current_schedules()
-    economic_status_info = ECONOMIC_STATUSES.get(
-        current_economic_status, ECONOMIC_STATUSES["moderate"])
 
-    return render_template(
-        'index.html',
-        municipalities=MUNICIPALITIES,
-        economic_status=current_economic_status,
+def canonical_area_path(prefix: str, municipality: str, area: str, suffix: str = "") -> str:
+    """Path of a per-area resource under the dataset's spelling of the names"""
+    return f"{prefix}/{quote(municipality, safe='')}/{quote(area, safe='')}{suffix}"
+
+
+def canonical_redirect_headers(path: str) -> Dict[str, str]:
+    """
+    Headers of a 308 from a misspelled or differently cased area URL to its
+    canonical one, so clients and caches keep a single key per area. Name
+    resolution follows the dataset, so the redirect is cached like it.
+    """
+    return {"Location": path, "Cache-Control": f"public, max-age={STATIC_MAX_AGE}"}
+
+
+# Page Cache
+
+# Most rendered pages kept per worker process
+PAGE_CACHE_SIZE = int(os.environ.get("SCHEDULE_PAGE_CACHE_SIZE", "1024"))
+# Whether schedule pages subscribe to the area's event stream to reload on a
+# status change. A subscriber holds a whole sync worker for as long as the tab
+# is open, so only turn it on with gevent workers (asgi.py turns it on, as it
+# serves the streams itself); otherwise pages reload once at the next change.
+PAGE_STREAMS = os.environ.get("SCHEDULE_PAGE_STREAMS", "0") == "1"
+
+
+class PageCache:
+    """
+    Bounded LRU of rendered pages (HTML, calendar feeds). An entry can expire
+    at a moment on the schedule clock, such as the next status change of the
+    page's area; the rest of what a page shows is part of its key.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pages: "OrderedDict[Tuple, Tuple[Optional[datetime.datetime], str]]" = OrderedDict()
+
+    def get(self, key: Tuple, now: datetime.datetime) -> Optional[str]:
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                return None
+            expires_at, page = entry
+            if expires_at is not None and now >= expires_at:
+                del self._pages[key]
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def put(self, key: Tuple, page: str, expires_at: Optional[datetime.datetime] = None) -> None:
+        with self._lock:
+            self._pages[key] = (expires_at, page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+
+page_cache = PageCache(PAGE_CACHE_SIZE)
+page_renders = SingleFlight("page")
+
+
+def page_context(active: ScheduleGeneration, **extra) -> Dict:
+    """Template variables shared by every rendering of index.html"""
+    economic_status_info = ECONOMIC_STATUSES.get(
+        active.status, ECONOMIC_STATUSES["moderate"])
+    return dict(
+        municipalities=schedule_store.dataset.municipalities(),
+        economic_status=active.status,
         economic_status_name=economic_status_info.name,
         economic_status_description=economic_status_info.description,
-        available_statuses=list(ECONOMIC_STATUSES.keys())
+        available_statuses=list(ECONOMIC_STATUSES.keys()),
+        # The page shows the time itself, so cached copies never go stale
+        schedule_timezone=str(clock.timezone),
+        page_streams=PAGE_STREAMS,
+        **extra
     )
 
 
-@app.route('/api/areas/<municipality>')
-def get_areas(municipality):
-    """API endpoint to get areas for a specific municipality"""
-    for muni in MUNICIPALITIES:
-        if muni["name"] == municipality:
-            return jsonify(muni["areas"])
-    return jsonify([])
+def render_cached_page(key: Tuple, now: datetime.datetime, context) -> str:
+    """
+    index.html for a key covering everything the page shows, rendered with
+    context() on a miss and reused until the key changes or the page's
+    `next_change` (the next status change it shows, if any) passes. Hits
+    cost neither context() nor the next change. Concurrent misses of one
+    key render it once.
+    """
+    page = page_cache.get(key, now)
+    if page is not None:
+        PAGE_CACHE_HIT.inc()
+        return page
 
+    def render() -> str:
+        rendered = page_cache.get(key, now)
+        if rendered is None:
+            PAGE_CACHE_MISS.inc()
+            variables = context()
+            rendered = render_template('index.html', **variables)
+            page_cache.put(key, rendered, variables.get("next_change"))
+        return rendered
 
-@app.route('/api/schedule/<municipality>/<area>')
-def get_schedule(municipality, area):
-    """API endpoint to get schedule for specific municipality and area"""
-    schedules = get_current_schedules()
-
-    if municipality in schedules and area in schedules[municipality]:
-        current_status = get_current_power_status(municipality, area)
-        economic_status_info = ECONOMIC_STATUSES.get(
-            current_economic_status, ECONOMIC_STATUSES["moderate"])
-
-        return jsonify({
-            "schedule": schedules[municipality][area],
-            "current_status": current_status,
-            "current_time": datetime.datetime.now().strftime("%H:%M"),
-            "economic_status": current_economic_status,
-            "economic_status_name": economic_status_info.name
-        })
-    return jsonify({"error": "Schedule not found"}), 404
+    return page_renders.do(key, render)
 
 
-@app.route('/api/economic-status', methods=['GET'])
-def get_economic_status():
-    """Get current economic status"""
+# Calendar Feeds
+
+# Calendar feeds kept per worker process
+CALENDAR_CACHE_SIZE = int(os.environ.get("SCHEDULE_CALENDAR_CACHE_SIZE", "4096"))
+
+calendar_cache = PageCache(CALENDAR_CACHE_SIZE)
+
+
+# Write Path
+
+# Writes each client may make per second on average, and in one burst.
+# Buckets are kept per worker process; a rate of 0 turns the limit off.
+WRITE_RATE = float(os.environ.get("SCHEDULE_WRITE_RATE", "1"))
+WRITE_BURST = float(os.environ.get("SCHEDULE_WRITE_BURST", "5"))
+# Clients whose buckets a worker remembers
+WRITE_LIMITER_CLIENTS = 10_000
+# Proxies in front of the app (nginx, a CDN) that append the address they
+# were connected from to X-Forwarded-For. Behind them every request comes
+# from the nearest proxy, so clients are told apart by the address the
+# outermost trusted proxy saw; hops added before that one are not trusted.
+TRUSTED_PROXIES = int(os.environ.get("SCHEDULE_TRUSTED_PROXIES", "0"))
+
+
+write_limiter = RateLimiter(WRITE_RATE, WRITE_BURST, WRITE_LIMITER_CLIENTS)
+
+
+def write_retry_after(remote_addr: Optional[str], forwarded_for: Optional[str]) -> Optional[int]:
+    """
+    Spend one write token of the client a request came from (see
+    TRUSTED_PROXIES); None if it had one, else the Retry-After seconds
+    """
+    wait = write_limiter.acquire(client_address(remote_addr, forwarded_for, TRUSTED_PROXIES))
+    if not wait:
+        return None
+    WRITES_THROTTLED.inc()
+    return max(1, math.ceil(wait))
+
+
+def rate_limited_write(view):
+    """Flask view decorator answering 429 once the client has used up its write tokens"""
+    @functools.wraps(view)
+    def limited(*args, **kwargs):
+        retry_after = write_retry_after(request.remote_addr, request.headers.get("X-Forwarded-For"))
+        if retry_after is not None:
+            response = jsonify({"error": "Too many writes, retry later"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(retry_after)
+            return response
+        return view(*args, **kwargs)
+    return limited
+
+
+status_writer = StatusWriter(lambda economic_status: schedule_store.activate(economic_status),
+                             lambda: transition_scheduler.schedules_changed(), STATUS_WRITES_COALESCED)
+
+
+# Shared Request Handling
+#
+# The Flask routes below and the ASGI app in asgi.py answer the same requests
+# through these helpers, so both serve identical bodies and headers.
+
+
+class ApiError(Exception):
+    """A rejected API request, answered with {"error": message} and an HTTP status"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def area_schedule_validators(active: ScheduleGeneration, municipality: str, area: str,
+                             area_index: IntervalIndex,
+                             now: datetime.datetime) -> Tuple[str, datetime.datetime, float]:
+    """
+    (ETag, Last-Modified, max-age) of an area's schedule response. The
+    response only changes when the schedules or overrides change or the
+    area's status flips, so the validator covers that state and max-age runs
+    until the next status change. current_time differs between responses
+    that share the same state, so the ETag must be sent as a weak validator.
+    """
+    minute = minute_of_day(now)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    run_start = area_index.current_run_start(minute)
+    override_start = override_run_start(active, municipality, area, now)
+    next_change = area_next_change(active, municipality, area, area_index, now)
+
+    etag = f"{active.tag}.{run_start}"
+    last_modified = utc_from_timestamp(active.changed_at)
+    if run_start is not None:
+        last_modified = max(
+            last_modified,
+            (midnight + datetime.timedelta(minutes=run_start)).astimezone(datetime.timezone.utc))
+    if override_start is not None:
+        etag += f".{override_start:.0f}"
+        last_modified = max(last_modified, utc_from_timestamp(override_start))
+    if next_change is not None:
+        max_age = (next_change - now).total_seconds()
+    else:
+        max_age = STATIC_MAX_AGE
+    return etag, last_modified, max_age
+
+
+def area_schedule_body(active: ScheduleGeneration, municipality: str, area: str,
+                       compiled_area: CompiledArea, now: datetime.datetime) -> bytes:
+    """JSON body of an area's schedule response"""
     economic_status_info = ECONOMIC_STATUSES.get(
-        current_economic_status, ECONOMIC_STATUSES["moderate"])
-    return jsonify({
-        "status": current_economic_status,
+        active.status, ECONOMIC_STATUSES["moderate"])
+
+    # The schedule is the same bytes for every caller in this generation, so
+    # only the small per-request fields are encoded here
+    fields = dumps_json({
+        "municipality": municipality,
+        "area": area,
+        "current_status": current_area_status(active, municipality, area, compiled_area.index, now),
+        "current_time": now.strftime("%H:%M"),
+        "economic_status": active.status,
+        "economic_status_name": economic_status_info.name,
+        "generation": active.generation,
+        "overrides": [override_json(event) for event in active.overrides.area_events(municipality, area)]
+    })
+    return b'{"schedule":' + compiled_area.schedule_json + b',' + fields[1:]
+
+
+def area_calendar_validators(active: ScheduleGeneration, municipality: str,
+                             area: str) -> Tuple[str, datetime.datetime]:
+    """
+    (ETag, Last-Modified) of an area's calendar feed. The feed only changes
+    with the schedule generation and the area's own override events, so
+    overrides of other areas leave it valid. Feeds built on different days
+    differ in their first occurrence only, hence a weak validator.
+    """
+    etag = f"ics.{active.generation}.{active.dataset_version}"
+    events = active.overrides.area_events(municipality, area)
+    if events:
+        etag += "." + hashlib.sha1(repr([(event.id, event.end) for event in events]).encode()).hexdigest()[:12]
+    return etag, utc_from_timestamp(active.changed_at)
+
+
+def area_calendar_body(active: ScheduleGeneration, municipality: str, area: str,
+                       compiled_area: CompiledArea, etag: str, now: datetime.datetime) -> bytes:
+    """An area's calendar feed, built once per ETag and then served from calendar_cache"""
+    key = (municipality, area, etag)
+    body = calendar_cache.get(key, now)
+    if body is not None:
+        CALENDAR_CACHE_HIT.inc()
+        return body
+    CALENDAR_CACHE_MISS.inc()
+    economic_status_info = ECONOMIC_STATUSES.get(active.status, ECONOMIC_STATUSES["moderate"])
+    body = build_area_calendar(municipality, area, compiled_area.schedule,
+                               active.overrides.area_events(municipality, area), economic_status_info.name,
+                               clock.timezone, now.date(), active.changed_at)
+    calendar_cache.put(key, body)
+    return body
+
+
+def override_json(event: OverrideEvent) -> Dict:
+    """An override event as it appears in API responses"""
+    return {
+        "id": event.id,
+        "municipality": event.municipality,
+        "area": event.area,
+        "start": datetime.datetime.fromtimestamp(event.start, clock.timezone).isoformat(),
+        "end": datetime.datetime.fromtimestamp(event.end, clock.timezone).isoformat(),
+        "status": event.status,
+        "reason": event.reason
+    }
+
+
+def parse_override_events(entries) -> List[Tuple[str, Optional[str], float, float, str, str]]:
+    """
+    Validate the events of a POST /api/overrides body into the rows
+    OverrideStore.add() takes. Times are truncated to the minute, like the
+    schedules. Raises ApiError for bad input.
+    """
+    if not isinstance(entries, list) or not 1 <= len(entries) <= MAX_OVERRIDE_EVENTS:
+        raise ApiError(f"'events' must be a list of 1 to {MAX_OVERRIDE_EVENTS} events")
+
+    statuses = {status.lower(): status for status in OVERRIDE_STATUSES}
+    active = schedule_store.active
+    rows = []
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ApiError(f"Event {position} must be an object")
+        municipality = entry.get('municipality')
+        area = entry.get('area')
+        if not isinstance(municipality, str) or (area is not None and not isinstance(area, str)):
+            raise ApiError(f"Event {position} needs a municipality and, optionally, an area")
+        if area is None:
+            if schedule_store.names.municipality(municipality) is None:
+                raise ApiError(f"Event {position}: municipality not found", 404)
+            municipality = resolve_municipality(municipality)
+        else:
+            municipality, area = resolve_area(municipality, area)
+            if active.index(municipality, area) is None:
+                raise ApiError(f"Event {position}: schedule not found", 404)
+
+        try:
+            start = clock.parse(entry['start']).replace(second=0, microsecond=0)
+            end = clock.parse(entry['end']).replace(second=0, microsecond=0)
+        except (KeyError, TypeError, ValueError):
+            raise ApiError(f"Event {position} needs ISO 8601 'start' and 'end' timestamps")
+        if end <= start:
+            raise ApiError(f"Event {position} must end after it starts")
+
+        status = statuses.get(str(entry.get('status', 'Power off')).lower())
+        if status is None:
+            raise ApiError(f"Event {position}: status must be one of {list(OVERRIDE_STATUSES)}")
+        rows.append((municipality, area, start.timestamp(), end.timestamp(), status,
+                     str(entry.get('reason', ''))))
+    return rows
+
+
+def economic_status_payload(active: ScheduleGeneration) -> Dict:
+    """Body of GET /api/economic-status"""
+    economic_status_info = ECONOMIC_STATUSES.get(
+        active.status, ECONOMIC_STATUSES["moderate"])
+    return {
+        "status": active.status,
         "name": economic_status_info.name,
         "description": economic_status_info.description,
         "power_on_multiplier": economic_status_info.power_on_multiplier,
-        "power_off_multiplier": economic_status_info.power_off_multiplier
-    })
+        "power_off_multiplier": economic_status_info.power_off_multiplier,
+        "generation": active.generation
+    }
 
 
-@app.route('/api/economic-status', methods=['POST'])
-def update_economic_status():
-    """Update economic status (regenerates all schedules)"""
+def set_economic_status(data) -> Dict:
+    """
+    Apply a POST /api/economic-status body (swapping in the precompiled
+    schedules, coalesced with concurrent writes) and return the response
+    body. Raises ApiError for bad input.
+    """
     global current_economic_status
 
-    data = request.get_json()
-    new_status = data.get('status', '').lower()
+    new_status = data.get('status', '').lower() if isinstance(data, dict) else ''
 
     if new_status not in ECONOMIC_STATUSES:
-        return jsonify({"error": f"Invalid status. Must be one of: {list(ECONOMIC_STATUSES.keys())}"}), 400
+        raise ApiError(f"Invalid status. Must be one of: {list(ECONOMIC_STATUSES.keys())}")
 
-    current_economic_status = new_status
-    economic_status_info = ECONOMIC_STATUSES[current_economic_status]
+    active = status_writer.write(new_status)
+    current_economic_status = active.status
+    economic_status_info = ECONOMIC_STATUSES[active.status]
 
-    return jsonify({
+    return {
         "message": "Economic status updated successfully",
-        "status": current_economic_status,
+        "status": active.status,
         "name": economic_status_info.name,
         "description": economic_status_info.description,
-        "schedules_regenerated": True
+        "schedules_regenerated": True,
+        "generation": active.generation
+    }
+
+
+def select_timeline(args) -> Tuple[List[Tuple[str, str, IntervalIndex, Optional[OverrideTimeline]]],
+                                   datetime.datetime, datetime.datetime]:
+    """
+    The areas (with their override timelines) and [start, end) range a
+    timeline export asks for through its query parameters (any mapping with
+    get()). Raises ApiError for bad input.
+    """
+    start_param = args.get('from')
+    try:
+        if start_param:
+            start = clock.parse(start_param)
+        else:
+            start = clock.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        days = int(args.get('days', 1))
+    except ValueError:
+        raise ApiError("Invalid 'from' or 'days'. Use an ISO 8601 date and a whole number of days")
+
+    if not 1 <= days <= MAX_TIMELINE_DAYS:
+        raise ApiError(f"'days' must be between 1 and {MAX_TIMELINE_DAYS}")
+
+    municipality = args.get('municipality')
+    area = args.get('area')
+    active = schedule_store.active
+    overrides = active.overrides
+
+    if area:
+        municipality, area = resolve_area(municipality, area)
+        area_index = active.index(municipality, area) if municipality else None
+        if area_index is None:
+            raise ApiError("Schedule not found", 404)
+        selected = [(municipality, area, area_index, overrides.timeline(municipality, area))]
+    else:
+        if municipality:
+            municipality = resolve_municipality(municipality)
+        indexes = active.indexes
+        if municipality and municipality not in indexes:
+            raise ApiError("Schedule not found", 404)
+        selected = [
+            (muni_name, area_name, area_index, overrides.timeline(muni_name, area_name))
+            for muni_name, areas in indexes.items() if not municipality or muni_name == municipality
+            for area_name, area_index in areas.items()
+        ]
+    return selected, start, start + datetime.timedelta(days=days)
+
+
+def timeline_lines(selected: List[Tuple[str, str, IntervalIndex, Optional[OverrideTimeline]]],
+                   start: datetime.datetime, end: datetime.datetime) -> Iterator[str]:
+    """NDJSON lines of every selected area's intervals in [start, end), overrides included"""
+    for muni_name, area_name, area_index, timeline in selected:
+        intervals = overlay_overrides(expand_timeline(area_index, start, end), timeline)
+        for interval_start, interval_end, status in intervals:
+            yield json.dumps({
+                "municipality": muni_name,
+                "area": area_name,
+                "start": interval_start.isoformat(),
+                "end": interval_end.isoformat(),
+                "status": status
+            }) + "\n"
+
+
+def open_status_stream(municipality: Optional[str], area: Optional[str]) -> Tuple[Optional[Tuple[str, str]], bytes]:
+    """
+    (transition hub key, first event) of an event stream for one area, or for
+    every area when no area is given. Raises ApiError for an unknown area.
+    """
+    active = schedule_store.active
+    now = clock.now()
+
+    if municipality is None:
+        return None, snapshot_event(active, now)
+    municipality, area = resolve_area(municipality, area)
+    if active.index(municipality, area) is None:
+        raise ApiError("Schedule not found", 404)
+    return (municipality, area), area_status_event(active, municipality, area, now)
+
+
+# Request Metrics
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profiling = profiler is not None and profiler.start()
+
+
+@app.teardown_request
+def record_request_latency(error=None):
+    """Observe the handler's latency under its route pattern (streamed bodies excluded)"""
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    if g.pop('profiling', False):
+        profiler.stop()
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    status = g.pop('response_status', 500 if error else 200)
+    REQUEST_LATENCY.labels(request.method, route, str(status)).observe(time.perf_counter() - started)
+
+
+@app.after_request
+def remember_response_status(response: Response) -> Response:
+    g.response_status = response.status_code
+    return response
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def record_render_latency(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        PHASE_LATENCY.labels("render").observe(time.perf_counter() - started)
+
+
+# Flask Routes
+
+
+@app.before_request
+def refresh_schedule_store():
+    """Pick up economic status changes from other workers and dataset changes"""
+    schedule_store.refresh()
+    transition_scheduler.start()
+
+
+@app.route('/')
+def index():
+    """Main page displaying power schedule interface"""
+    active = schedule_store.active
+    return render_cached_page(("index", active.tag), clock.now(), lambda: page_context(active))
+
+
+@app.route('/api/areas/<municipality>')
+def get_areas(municipality):
+    """API endpoint to get areas for a specific municipality"""
+    dataset = schedule_store.dataset
+    etag = f"areas.{dataset.version}"
+    last_modified = utc_from_timestamp(dataset.modified_at)
+
+    if is_not_modified(etag, last_modified):
+        return with_cache_headers(Response(status=304), etag, last_modified, STATIC_MAX_AGE)
+
+    response = Response(schedule_store.area_list_json(municipality), mimetype='application/json')
+    return with_cache_headers(response, etag, last_modified, STATIC_MAX_AGE)
+
+
+@app.route('/api/search')
+def search_areas():
+    """
+    Autocomplete over area names: areas whose name starts with `q` first,
+    then similar names, tolerating case, accents, spacing and typos.
+    """
+    query = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', 10)), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return jsonify({"error": "'limit' must be a whole number"}), 400
+
+    # Results only change with the dataset
+    dataset = schedule_store.dataset
+    etag = f"search.{dataset.version}"
+    last_modified = utc_from_timestamp(dataset.modified_at)
+    if is_not_modified(etag, last_modified):
+        return with_cache_headers(Response(status=304), etag, last_modified, STATIC_MAX_AGE)
+
+    body = dumps_json({
+        "query": query,
+        "results": [
+            {"municipality": municipality, "area": area, "score": score}
+            for municipality, area, score in schedule_store.names.search(query, limit)
+        ]
+    })
+    return with_cache_headers(Response(body, mimetype='application/json'), etag, last_modified, STATIC_MAX_AGE)
+
+
+@app.route('/api/schedule/<municipality>/<area>')
+def get_schedule(municipality, area):
+    """
+    API endpoint to get schedule for specific municipality and area.
+    The response carries a validator and a max-age running until the area's
+    next status change (see area_schedule_validators). Names spelled other
+    than the dataset does are redirected to the canonical URL.
+    """
+    active = schedule_store.active
+    requested = (municipality, area)
+    municipality, area = resolve_area(municipality, area)
+    compiled_area = active.area(municipality, area)
+
+    if compiled_area is None:
+        return jsonify({"error": "Schedule not found"}), 404
+    if (municipality, area) != requested:
+        path = canonical_area_path("/api/schedule", municipality, area)
+        return Response(status=308, headers=canonical_redirect_headers(request.script_root + path))
+
+    now = clock.now()
+    etag, last_modified, max_age = area_schedule_validators(active, municipality, area, compiled_area.index, now)
+
+    if is_not_modified(etag, last_modified):
+        return with_cache_headers(Response(status=304), etag, last_modified, max_age, weak=True)
+
+    response = Response(area_schedule_body(active, municipality, area, compiled_area, now),
+                        mimetype='application/json')
+    return with_cache_headers(response, etag, last_modified, max_age, weak=True)
+
+
+@app.route('/api/calendar/<municipality>/<area>.ics')
+def get_calendar(municipality, area):
+    """
+    iCalendar feed of an area's outages for calendar apps to subscribe to.
+    Refetches within one schedule generation are answered with 304, and
+    names spelled other than the dataset does are redirected.
+    """
+    active = schedule_store.active
+    requested = (municipality, area)
+    municipality, area = resolve_area(municipality, area)
+    compiled_area = active.area(municipality, area)
+
+    if compiled_area is None:
+        return jsonify({"error": "Schedule not found"}), 404
+    if (municipality, area) != requested:
+        path = canonical_area_path("/api/calendar", municipality, area, ".ics")
+        return Response(status=308, headers=canonical_redirect_headers(request.script_root + path))
+
+    etag, last_modified = area_calendar_validators(active, municipality, area)
+
+    if is_not_modified(etag, last_modified):
+        return with_cache_headers(Response(status=304), etag, last_modified, STATIC_MAX_AGE, weak=True)
+
+    body = area_calendar_body(active, municipality, area, compiled_area, etag, clock.now())
+    return with_cache_headers(Response(body, mimetype='text/calendar'), etag, last_modified, STATIC_MAX_AGE,
+                              weak=True)
+
+
+@app.route('/api/next-change/<municipality>/<area>')
+def get_next_change(municipality, area):
+    """API endpoint to get when an area's power status next changes"""
+    at = request.args.get('at')
+    try:
+        moment = clock.parse(at) if at else clock.now()
+    except ValueError:
+        return jsonify({"error": "Invalid 'at' timestamp. Use ISO 8601 format"}), 400
+
+    municipality, area = resolve_area(municipality, area)
+    if schedule_store.active.index(municipality, area) is None:
+        return jsonify({"error": "Schedule not found"}), 404
+
+    next_change = get_next_power_change(municipality, area, moment)
+    return jsonify({
+        "at": moment.isoformat(),
+        "current_status": get_power_status_at(municipality, area, moment),
+        "next_change": next_change.isoformat() if next_change else None,
+        "next_status": get_power_status_at(municipality, area, next_change) if next_change else None
+    })
+
+
+@app.route('/api/status/bulk', methods=['POST'])
+def get_bulk_status():
+    """
+    API endpoint to get the status of many areas at many timestamps in one call.
+    Body: {"areas": "all" | [{"municipality": ..., "area": ...}, ...],
+           "timestamps": ["2025-06-01T14:30", ...]}
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    active = schedule_store.active
+    packed = active.packed
+
+    requested_areas = data.get('areas', 'all')
+    if requested_areas == 'all':
+        positions = list(range(len(packed.areas)))
+    elif isinstance(requested_areas, list):
+        positions = []
+        unknown_areas = []
+        for entry in requested_areas:
+            if isinstance(entry, dict):
+                key = (entry.get('municipality'), entry.get('area'))
+            elif isinstance(entry, (list, tuple)) and len(entry) == 2:
+                key = tuple(entry)
+            else:
+                key = None
+            if key is None or not all(isinstance(name, str) for name in key):
+                return jsonify({"error": "Each area must be {\"municipality\": ..., \"area\": ...}"}), 400
+            if key not in packed.positions:
+                key = resolve_area(*key)
+            if key in packed.positions:
+                positions.append(packed.positions[key])
+            else:
+                unknown_areas.append({"municipality": key[0], "area": key[1]})
+        if unknown_areas:
+            return jsonify({"error": "Schedule not found", "areas": unknown_areas}), 404
+    else:
+        return jsonify({"error": "'areas' must be \"all\" or a list of areas"}), 400
+
+    timestamps = data.get('timestamps')
+    if timestamps is None:
+        moments = [clock.now()]
+    elif isinstance(timestamps, list) and len(timestamps) <= MAX_BULK_TIMESTAMPS:
+        try:
+            moments = [clock.parse(timestamp) for timestamp in timestamps]
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid timestamp. Use ISO 8601 format"}), 400
+    else:
+        return jsonify({"error": f"'timestamps' must be a list of at most {MAX_BULK_TIMESTAMPS} timestamps"}), 400
+
+    snapshot = None
+    if timestamps is None:
+        snapshot = transition_scheduler.current(moments[0], active)
+        (SNAPSHOT_MISS if snapshot is None else SNAPSHOT_HIT).inc()
+
+    if snapshot is not None:
+        # Now, overrides included: a read of the transition timer's snapshot
+        codes = [[STATUS_CODES[snapshot.statuses.get(packed.areas[position], "Unknown")]]
+                 for position in positions]
+    else:
+        codes = packed.lookup(positions, [minute_of_day(moment) for moment in moments])
+
+    overrides = active.overrides
+    if snapshot is None and overrides.timelines:
+        timestamps = [moment.timestamp() for moment in moments]
+        for row, position in zip(codes, positions):
+            timeline = overrides.timelines.get(packed.areas[position])
+            if timeline is None:
+                continue
+            for column, timestamp in enumerate(timestamps):
+                override = timeline.status_at(timestamp)
+                if override is not None:
+                    row[column] = STATUS_CODES[override]
+
+    return jsonify({
+        "areas": [
+            {"municipality": packed.areas[position][0], "area": packed.areas[position][1]}
+            for position in positions
+        ],
+        "timestamps": [moment.isoformat() for moment in moments],
+        "statuses": [[STATUS_NAMES[code] for code in row] for row in codes],
+        "economic_status": active.status,
+        "generation": active.generation
+    })
+
+
+@app.route('/api/timeline')
+def get_timeline():
+    """
+    API endpoint streaming the concrete on/off intervals of every area (or one
+    municipality/area) for N days ahead as NDJSON, one interval per line.
+    """
+    try:
+        selected, start, end = select_timeline(request.args)
+    except ApiError as error:
+        return jsonify({"error": error.message}), error.status
+
+    return Response(timeline_lines(selected, start, end), mimetype='application/x-ndjson')
+
+
+@app.route('/api/stream')
+@app.route('/api/stream/<municipality>/<area>')
+def stream_status(municipality=None, area=None):
+    """
+    Server-Sent Events stream of status changes for one area, or for every
+    area when no area is given. Events are pushed when a status flips and
+    when the economic status changes.
+    """
+    try:
+        key, initial = open_status_stream(municipality, area)
+    except ApiError as error:
+        return jsonify({"error": error.message}), error.status
+
+    subscriber = transition_hub.subscribe(key)
+
+    def generate():
+        try:
+            yield initial
+            while True:
+                try:
+                    yield subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield b": keepalive\n\n"
+        finally:
+            transition_hub.unsubscribe(key, subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
+
+
+@app.route('/api/economic-status', methods=['GET'])
+def get_economic_status():
+    """Get current economic status"""
+    return jsonify(economic_status_payload(schedule_store.active))
+
+
+@app.route('/api/economic-status', methods=['POST'])
+@rate_limited_write
+def update_economic_status():
+    """Update economic status (swaps in the precompiled schedules)"""
+    try:
+        return jsonify(set_economic_status(request.get_json(silent=True)))
+    except ApiError as error:
+        return jsonify({"error": error.message}), error.status
+
+
+@app.route('/api/overrides', methods=['GET'])
+def get_overrides():
+    """Override events that have not ended, optionally of one municipality or area"""
+    municipality = request.args.get('municipality')
+    area = request.args.get('area')
+    if municipality and area:
+        municipality, area = resolve_area(municipality, area)
+    elif municipality:
+        municipality = resolve_municipality(municipality)
+
+    active = schedule_store.active
+    now = clock.now().timestamp()
+    events = [
+        event for event in active.overrides.events.values()
+        if event.end > now
+        and (not municipality or event.municipality == municipality)
+        and (not area or event.area in (None, area))
+    ]
+    return Response(dumps_json({
+        "revision": active.overrides.revision,
+        "overrides": [override_json(event) for event in events]
+    }), mimetype='application/json')
+
+
+@app.route('/api/overrides', methods=['POST'])
+@rate_limited_write
+def add_overrides():
+    """
+    Add override events in bulk. Only the timelines of the areas they touch
+    are rebuilt.
+    Body: {"events": [{"municipality": ..., "area": ... (omit for the whole
+                       municipality), "start": ..., "end": ...,
+                       "status": "Power off" | "Power on", "reason": ...}, ...]}
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    try:
+        rows = parse_override_events(data.get('events'))
+    except ApiError as error:
+        return jsonify({"error": error.message}), error.status
+
+    added = schedule_store.override_store.add(rows)
+    active = schedule_store.reload_overrides()
+    transition_scheduler.schedules_changed()
+    return Response(dumps_json({
+        "revision": active.overrides.revision,
+        "overrides": [override_json(event) for event in added]
+    }), status=201, mimetype='application/json')
+
+
+@app.route('/api/overrides/expire', methods=['POST'])
+@rate_limited_write
+def expire_overrides():
+    """
+    End override events now; events that have not started are cancelled.
+    Body: {"ids": [1, 2, ...]} or {"municipality": ..., "area": ... (optional)}
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    ids = data.get('ids')
+    municipality = data.get('municipality')
+    area = data.get('area')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(event_id, int) and not isinstance(event_id, bool)
+                                                for event_id in ids):
+            return jsonify({"error": "'ids' must be a list of event ids"}), 400
+        expired = schedule_store.override_store.expire(clock.now().timestamp(), ids=ids)
+    elif isinstance(municipality, str):
+        if isinstance(area, str):
+            municipality, area = resolve_area(municipality, area)
+        else:
+            municipality, area = resolve_municipality(municipality), None
+        expired = schedule_store.override_store.expire(
+            clock.now().timestamp(), municipality=municipality, area=area)
+    else:
+        return jsonify({"error": "Give the 'ids' of the events or a 'municipality' (and 'area')"}), 400
+
+    active = schedule_store.reload_overrides() if expired else schedule_store.active
+    if expired:
+        transition_scheduler.schedules_changed()
+    return jsonify({
+        "revision": active.overrides.revision,
+        "expired": [event.id for event in expired]
     })
 
 
+@app.route('/api/stats')
+def get_stats():
+    """
+    Outage statistics of every area and municipality under the active
+    economic status. The report only changes with the schedule generation.
+    """
+    active = schedule_store.active
+    etag = f"stats.{active.generation}.{active.dataset_version}"
+    last_modified = utc_from_timestamp(active.changed_at)
+
+    # The economic status can change at any moment, so clients revalidate
+    if is_not_modified(etag, last_modified):
+        return with_cache_headers(Response(status=304), etag, last_modified, 0)
+
+    response = Response(outage_stats.report_json(active, schedule_store.dataset), mimetype='application/json')
+    return with_cache_headers(response, etag, last_modified, 0)
+
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate_statuses():
+    """
+    What-if comparison of economic statuses without changing the active one.
+    Body: {"scenarios": {"name": "poor" | {"power_on_multiplier": 0.7,
+                                           "power_off_multiplier": 1.3}, ...},
+           "include_areas": true}
+    A list of status names also works; by default every economic status is
+    simulated.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+    requested = data.get('scenarios', list(ECONOMIC_STATUSES))
+    if isinstance(requested, list):
+        if not all(isinstance(name, str) for name in requested):
+            return jsonify({"error": "A 'scenarios' list must hold economic status names"}), 400
+        requested = {name: name for name in requested}
+    if not isinstance(requested, dict) or not 1 <= len(requested) <= MAX_SIMULATION_SCENARIOS:
+        return jsonify({"error": f"'scenarios' must name 1 to {MAX_SIMULATION_SCENARIOS} scenarios"}), 400
+
+    scenarios = {}
+    for name, scenario in requested.items():
+        if isinstance(scenario, str) and scenario.lower() in ECONOMIC_STATUSES:
+            scenarios[name] = ECONOMIC_STATUSES[scenario.lower()]
+            continue
+        multipliers = [scenario.get(key) if isinstance(scenario, dict) else None
+                       for key in ('power_on_multiplier', 'power_off_multiplier')]
+        if not all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                   and 0 <= value <= MAX_SIMULATION_MULTIPLIER for value in multipliers):
+            return jsonify({"error": f"Scenario {name!r} must be one of {list(ECONOMIC_STATUSES.keys())} "
+                                     f"or two multipliers between 0 and {MAX_SIMULATION_MULTIPLIER}"}), 400
+        scenarios[name] = EconomicStatus(str(name), float(multipliers[0]), float(multipliers[1]), "Custom scenario")
+
+    results = simulate(schedule_store.slot_table, scenarios)
+    if not data.get('include_areas', True):
+        for result in results.values():
+            del result['areas']
+
+    active = schedule_store.active
+    return Response(dumps_json({
+        "economic_status": active.status,
+        "generation": active.generation,
+        "scenarios": results
+    }), mimetype='application/json')
+
+
 @app.route('/schedule')
 def schedule_page():
-    """Display schedule for specific municipality and area"""
+    """
+    Display schedule for specific municipality and area. The page only
+    changes with the selection, the schedules and the area's current status,
+    so it is cached until the area's next status change.
+    """
     municipality = request.args.get('municipality')
     area = request.args.get('area')
+    active = schedule_store.active
+    now = clock.now()
 
     if not municipality or not area:
-        schedules = get_current_schedules()
-        economic_status_info = ECONOMIC_STATUSES.get(
-            current_economic_status, ECONOMIC_STATUSES["moderate"])
-        return render_template(
-            'index.html',
-            municipalities=MUNICIPALITIES,
-            economic_status=current_economic_status,
-            economic_status_name=economic_status_info.name,
-            economic_status_description=economic_status_info.description,
-            available_statuses=list(ECONOMIC_STATUSES.keys()),
-            error="Please select both municipality and area"
-        )
+        error = "Please select both municipality and area"
+        return render_cached_page(("error", error, active.tag), now,
+                                  lambda: page_context(active, error=error))
 
-    schedules = get_current_schedules()
-
-    if municipality not in schedules or area not in schedules[municipality]:
-        economic_status_info = ECONOMIC_STATUSES.get(
-            current_economic_status, ECONOMIC_STATUSES["moderate"])
-        return render_template(
-            'index.html',
-            municipalities=MUNICIPALITIES,
-            economic_status=current_economic_status,
-            economic_status_name=economic_status_info.name,
-            economic_status_description=economic_status_info.description,
-            available_statuses=list(ECONOMIC_STATUSES.keys()),
-            error="Schedule not found for the selected location"
-        )
+    municipality, area = resolve_area(municipality, area)
+    compiled_area = active.area(municipality, area)
 
-    area_schedule = schedules[municipality][area]
-    current_status = get_current_power_status(municipality, area)
-    current_time = datetime.datetime.now().strftime("%H:%M")
-    economic_status_info = ECONOMIC_STATUSES.get(
-        current_economic_status, ECONOMIC_STATUSES["moderate"])
-
-    return render_template(
-        'index.html',
-        municipalities=MUNICIPALITIES,
-        selected_municipality=municipality,
-        selected_area=area,
-        schedule=area_schedule,
-        current_status=current_status,
-        current_time=current_time,
-        economic_status=current_economic_status,
-        economic_status_name=economic_status_info.name,
-        economic_status_description=economic_status_info.description,
-        available_statuses=list(ECONOMIC_STATUSES.keys())
-    )
+    if compiled_area is None:
+        error = "Schedule not found for the selected location"
+        return render_cached_page(("error", error, active.tag), now,
+                                  lambda: page_context(active, error=error))
+
+    area_index = compiled_area.index
+    run_start = (area_index.current_run_start(minute_of_day(now)),
+                 override_run_start(active, municipality, area, now))
+
+    return render_cached_page(
+        ("schedule", municipality, area, active.tag, run_start), now,
+        lambda: page_context(
+            active,
+            selected_municipality=municipality,
+            selected_area=area,
+            schedule=compiled_area.schedule,
+            current_status=current_area_status(active, municipality, area, area_index, now),
+            next_change=area_next_change(active, municipality, area, area_index, now)
+        ))
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics of this worker process"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# CLI Commands
+
+
+@app.cli.command('export-dataset')
+@click.argument('path')
+def export_dataset(path):
+    """Export the built-in municipalities and schedules to a SQLite dataset"""
+    export_sqlite(path, MUNICIPALITIES, BASE_SCHEDULES)
+    click.echo(f"Dataset written to {path}")
+
+
+@app.cli.command('build-snapshot')
+@click.argument('path')
+def build_snapshot(path):
+    """Compile the active dataset's schedules into a snapshot for SCHEDULE_SNAPSHOT"""
+    area_count = build_snapshot_file(path, schedule_store.dataset)
+    click.echo(f"Snapshot of {area_count} areas x {len(ECONOMIC_STATUSES)} economic statuses written to {path}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,160 @@
+"""
+Lookup index over municipality and area names.
+
+Clients type names by hand, so "kilamba city", "Zango1" and "Hoji ya Henda"
+should all find the area the dataset spells "Kilamba City", "Zango 1" and
+"Hoji-ya-Henda". Names are compared by a folded key (accents stripped,
+case folded, everything but letters and digits dropped), and a trigram index
+over the area keys tolerates typos and backs the autocomplete endpoint.
+"""
+import bisect
+import heapq
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; trigram counting falls back to Counter
+    np = None
+
+# Lowest trigram similarity (0-1) a search result may have
+MIN_SIMILARITY = 0.3
+
+# Lowest similarity for a misspelt name to be resolved to an area, which must
+# also beat every other candidate
+MIN_RESOLVE_SIMILARITY = 0.5
+
+
+def fold_name(name: str) -> str:
+    """Comparison key of a name: no accents, case folded, letters and digits only"""
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(char for char in decomposed.casefold() if char.isalnum())
+
+
+def trigrams(key: str) -> List[str]:
+    """Distinct trigrams of a folded key, padded so the start of the name weighs more"""
+    padded = f"  {key} "
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+
+class AreaNameIndex:
+    """
+    Folded-name lookups and trigram search over every area of a dataset.
+    Built once per dataset version; lookups never scan the area list.
+    """
+
+    def __init__(self, municipalities: List[Dict]):
+        self._municipalities: Dict[str, str] = {}
+        self._areas: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        # Search entries, in dataset order: (municipality, area, folded area)
+        self.entries: List[Tuple[str, str, str]] = []
+        self._gram_counts: List[int] = []
+        postings: Dict[str, List[int]] = {}
+
+        for municipality in municipalities:
+            municipality_key = fold_name(municipality["name"])
+            self._municipalities.setdefault(municipality_key, municipality["name"])
+            for area in municipality["areas"]:
+                area_key = fold_name(area)
+                self._areas.setdefault((municipality_key, area_key), (municipality["name"], area))
+                position = len(self.entries)
+                self.entries.append((municipality["name"], area, area_key))
+                grams = trigrams(area_key)
+                self._gram_counts.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, []).append(position)
+
+        # Sorted folded keys for prefix (autocomplete) matches
+        self._prefixes = sorted((key, position) for position, (_, _, key) in enumerate(self.entries))
+        self._prefix_keys = [key for key, _ in self._prefixes]
+
+        if np is not None:
+            self._postings = {gram: np.asarray(positions, dtype=np.int32) for gram, positions in postings.items()}
+            self._gram_count_array = np.asarray(self._gram_counts, dtype=np.float64)
+        else:
+            self._postings = postings
+
+    def municipality(self, name: str) -> Optional[str]:
+        """The dataset's spelling of a municipality name, or None"""
+        return self._municipalities.get(fold_name(name))
+
+    def area(self, municipality: str, area: str) -> Optional[Tuple[str, str]]:
+        """
+        The dataset's (municipality, area) for a possibly misspelt pair, or
+        None. A folded match wins; otherwise the most similar area of the
+        municipality, if it is similar enough and unambiguous.
+        """
+        municipality_name = self.municipality(municipality)
+        if municipality_name is None:
+            return None
+        municipality_key = fold_name(municipality_name)
+        area_key = fold_name(area)
+        found = self._areas.get((municipality_key, area_key))
+        if found is not None:
+            return found
+
+        scored = [
+            (position, score) for position, score in self._similar(area_key, MIN_RESOLVE_SIMILARITY)
+            if self.entries[position][0] == municipality_name
+        ]
+        if scored and (len(scored) == 1 or scored[0][1] > scored[1][1]):
+            entry = self.entries[scored[0][0]]
+            return entry[0], entry[1]
+        return None
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, str, float]]:
+        """
+        Areas matching a partial or misspelt name, best first, as
+        (municipality, area, score). Names starting with the query score 1.
+        """
+        key = fold_name(query)
+        if not key or limit <= 0:
+            return []
+
+        results = []
+        seen = set()
+        start = bisect.bisect_left(self._prefix_keys, key)
+        for prefix_key, position in self._prefixes[start:start + limit]:
+            if not prefix_key.startswith(key):
+                break
+            results.append((position, 1.0))
+            seen.add(position)
+
+        if len(results) < limit:
+            similar = self._similar(key, MIN_SIMILARITY, limit)
+            results.extend([item for item in similar if item[0] not in seen][:limit - len(results)])
+
+        return [(self.entries[position][0], self.entries[position][1], round(score, 3))
+                for position, score in results]
+
+    def _similar(self, key: str, min_score: float,
+                 limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        (entry position, Dice similarity of trigrams) of the entries at least
+        min_score similar to a folded key, best first, at most `limit` of them
+        """
+        query_grams = trigrams(key)
+        grams = [gram for gram in query_grams if gram in self._postings]
+        if not grams:
+            return []
+
+        if np is not None:
+            shared = np.bincount(np.concatenate([self._postings[gram] for gram in grams]),
+                                 minlength=len(self.entries))
+            scores = 2.0 * shared / (self._gram_count_array + len(query_grams))
+            positions = np.flatnonzero(scores >= min_score)
+            if limit is not None and len(positions) > limit:
+                positions = positions[np.argpartition(-scores[positions], limit - 1)[:limit]]
+            positions = positions[np.lexsort((positions, -scores[positions]))]
+            return list(zip(positions.tolist(), scores[positions].tolist()))
+
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings[gram])
+        scored = [(position, 2.0 * count / (self._gram_counts[position] + len(query_grams)))
+                  for position, count in shared.items()]
+        scored = [item for item in scored if item[1] >= min_score]
+        if limit is None:
+            return sorted(scored, key=lambda item: (-item[1], item[0]))
+        return heapq.nsmallest(limit, scored, key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,255 @@
+"""
+ASGI entry point for serving the tracker on uvicorn.
+
+The areas, schedule, calendar, economic status, timeline and event stream
+endpoints are native async handlers, so a slow or long-lived client holds a
+coroutine instead of a whole worker. They share the schedule engine, caches and
+transition timer with the Flask app and answer with the same bodies and
+headers. Engine calls that can block (compiling an area, status writes,
+all-area views) run in the thread pool, off the event loop. Every other route
+(the pages, bulk status, next change, /metrics) is the Flask app itself,
+mounted underneath.
+
+    pip install '.[asgi]'
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import time
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Match, Mount, Route
+from werkzeug.http import parse_date, parse_etags
+
+import app as schedule_app
+from app import (
+    REQUEST_LATENCY, SSE_KEEPALIVE_SECONDS, STATIC_MAX_AGE, ApiError, area_calendar_body,
+    area_calendar_validators, area_schedule_body, area_schedule_validators, cache_headers, canonical_area_path,
+    canonical_redirect_headers, dumps_json, economic_status_payload, open_status_stream,
+    resolve_area, schedule_store, select_timeline, set_economic_status, timeline_lines, transition_hub,
+    transition_scheduler, utc_from_timestamp, validators_match, write_retry_after
+)
+
+# The event streams are native handlers here, so a subscribed page holds a coroutine, not a worker
+schedule_app.PAGE_STREAMS = True
+
+
+def json_response(value, status: int = 200) -> Response:
+    return Response(dumps_json(value), status_code=status, media_type="application/json")
+
+
+def error_response(error: ApiError) -> Response:
+    return json_response({"error": error.message}, error.status)
+
+
+def canonical_redirect(request: Request, path: str) -> Response:
+    root_path = request.scope.get("root_path", "")
+    return Response(status_code=308, headers=canonical_redirect_headers(root_path + path))
+
+
+def not_modified(request: Request, etag: str, last_modified) -> bool:
+    """Whether the request's validators match this representation"""
+    if_none_match = request.headers.get("if-none-match")
+    return validators_match(
+        parse_etags(if_none_match) if if_none_match else None,
+        parse_date(request.headers.get("if-modified-since")),
+        etag, last_modified)
+
+
+class AsyncSubscriber:
+    """Transition hub subscriber that hands events to a coroutine on the event loop"""
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def put(self, message: bytes) -> None:
+        # Called from the transition timer thread
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+
+    async def get(self) -> bytes:
+        return await self._queue.get()
+
+
+# Routes
+
+
+async def get_areas(request: Request) -> Response:
+    """API endpoint to get areas for a specific municipality"""
+    dataset = schedule_store.dataset
+    etag = f"areas.{dataset.version}"
+    last_modified = utc_from_timestamp(dataset.modified_at)
+    headers = cache_headers(etag, last_modified, STATIC_MAX_AGE)
+
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    municipality = request.path_params["municipality"]
+    return Response(schedule_store.area_list_json(municipality), media_type="application/json",
+                    headers=headers)
+
+
+async def get_schedule(request: Request) -> Response:
+    """API endpoint to get schedule for specific municipality and area"""
+    active = schedule_store.active
+    requested = (request.path_params["municipality"], request.path_params["area"])
+    municipality, area = resolve_area(*requested)
+    # A first request compiles the area (or waits for another request compiling it)
+    compiled_area = await run_in_threadpool(active.area, municipality, area)
+
+    if compiled_area is None:
+        return json_response({"error": "Schedule not found"}, 404)
+    if (municipality, area) != requested:
+        return canonical_redirect(request, canonical_area_path("/api/schedule", municipality, area))
+
+    now = schedule_app.clock.now()
+    etag, last_modified, max_age = area_schedule_validators(active, municipality, area, compiled_area.index, now)
+    headers = cache_headers(etag, last_modified, max_age, weak=True)
+
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    return Response(area_schedule_body(active, municipality, area, compiled_area, now),
+                    media_type="application/json", headers=headers)
+
+
+async def get_calendar(request: Request) -> Response:
+    """iCalendar feed of an area's outages for calendar apps to subscribe to"""
+    active = schedule_store.active
+    requested = (request.path_params["municipality"], request.path_params["area"])
+    municipality, area = resolve_area(*requested)
+    compiled_area = await run_in_threadpool(active.area, municipality, area)
+
+    if compiled_area is None:
+        return json_response({"error": "Schedule not found"}, 404)
+    if (municipality, area) != requested:
+        return canonical_redirect(request, canonical_area_path("/api/calendar", municipality, area, ".ics"))
+
+    etag, last_modified = area_calendar_validators(active, municipality, area)
+    headers = cache_headers(etag, last_modified, STATIC_MAX_AGE, weak=True)
+
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body = area_calendar_body(active, municipality, area, compiled_area, etag, schedule_app.clock.now())
+    return Response(body, media_type="text/calendar; charset=utf-8", headers=headers)
+
+
+async def get_economic_status(request: Request) -> Response:
+    """Get current economic status"""
+    return json_response(economic_status_payload(schedule_store.active))
+
+
+async def update_economic_status(request: Request) -> Response:
+    """Update economic status (swaps in the precompiled schedules)"""
+    retry_after = write_retry_after(request.client.host if request.client else None,
+                                    request.headers.get("x-forwarded-for"))
+    if retry_after is not None:
+        return Response(dumps_json({"error": "Too many writes, retry later"}), status_code=429,
+                        media_type="application/json", headers={"Retry-After": str(retry_after)})
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    try:
+        # Takes the status writer's lock and the shared state file's lock
+        return json_response(await run_in_threadpool(set_economic_status, data))
+    except ApiError as error:
+        return error_response(error)
+
+
+async def get_timeline(request: Request) -> Response:
+    """Stream the dated on/off intervals of the selected areas as NDJSON"""
+    try:
+        # Selecting every area assembles the all-area indexes
+        selected, start, end = await run_in_threadpool(select_timeline, request.query_params)
+    except ApiError as error:
+        return error_response(error)
+
+    # A sync iterator, so Starlette expands it in its thread pool
+    return StreamingResponse(timeline_lines(selected, start, end), media_type="application/x-ndjson")
+
+
+async def stream_status(request: Request) -> Response:
+    """Server-Sent Events stream of status changes for one area, or for every area"""
+    try:
+        key, initial = await run_in_threadpool(open_status_stream, request.path_params.get("municipality"),
+                                               request.path_params.get("area"))
+    except ApiError as error:
+        return error_response(error)
+
+    subscriber = transition_hub.subscribe(key, AsyncSubscriber())
+
+    async def generate():
+        try:
+            yield initial
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+        finally:
+            transition_hub.unsubscribe(key, subscriber)
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Stop nginx from buffering the stream
+    })
+
+
+class ScheduleMiddleware:
+    """
+    Does for the native routes what the Flask request hooks do for Flask's:
+    follows economic status and dataset changes, keeps the transition timer
+    running and records request latency (until the response starts, so
+    streamed bodies are excluded). The refresh reads shared state and may
+    recompile, so it runs in the thread pool; requests for the mounted Flask
+    app skip it, as Flask's own before_request hook refreshes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if is_native(scope):
+            await run_in_threadpool(schedule_store.refresh)
+            transition_scheduler.start()
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            route = scope.get("route")
+            if message["type"] == "http.response.start" and isinstance(route, Route):
+                REQUEST_LATENCY.labels(scope["method"], route.path, str(message["status"])).observe(
+                    time.perf_counter() - started)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+def is_native(scope) -> bool:
+    """Whether a request goes to a native route (any method) rather than to the mounted Flask app"""
+    return any(route.matches(scope)[0] != Match.NONE for route in native_routes)
+
+
+native_routes = [
+    Route("/api/areas/{municipality}", get_areas),
+    Route("/api/schedule/{municipality}/{area}", get_schedule),
+    Route("/api/calendar/{municipality}/{area}.ics", get_calendar),
+    Route("/api/economic-status", get_economic_status, methods=["GET"]),
+    Route("/api/economic-status", update_economic_status, methods=["POST"]),
+    Route("/api/timeline", get_timeline),
+    Route("/api/stream", stream_status),
+    Route("/api/stream/{municipality}/{area}", stream_status),
+]
+
+app = Starlette(routes=native_routes + [
+    Mount("/", WSGIMiddleware(schedule_app.app)),
+])
+app.add_middleware(ScheduleMiddleware)
@@ -0,0 +1,216 @@
+"""
+Benchmarks for the schedule engine and the Flask endpoints.
+
+Runs every case against the built-in dataset (size "builtin") and against
+synthetic datasets scaled up to the requested number of areas, driving the
+routes through Flask's test client. Results can be saved as a JSON baseline
+and later runs checked against it:
+
+    python benchmark.py --sizes builtin,10000,100000 --save-baseline
+    python benchmark.py --sizes builtin,10000,100000 --check
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from jinja2 import TemplateNotFound
+
+import app as schedule_app
+from dataset import InMemoryDataset
+from overrides import OverrideStore
+from shared_state import LocalStatusState
+from snapshot import load_snapshot
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+# --sizes entry for the built-in dataset
+BUILTIN_SIZE = "builtin"
+AREAS_PER_SYNTHETIC_MUNICIPALITY = 100
+# Override events layered on one area for the override lookup case
+OVERRIDE_EVENTS = 5000
+
+
+def synthetic_dataset(area_count: int):
+    """Build MUNICIPALITIES/BASE_SCHEDULES-shaped data by cycling the real templates"""
+    templates = itertools.cycle([
+        slots for areas in schedule_app.BASE_SCHEDULES.values() for slots in areas.values()
+    ])
+    municipalities = []
+    base_schedules = {}
+    for number in range(area_count):
+        municipality = f"Synthetic {number // AREAS_PER_SYNTHETIC_MUNICIPALITY}"
+        area = f"Area {number}"
+        if municipality not in base_schedules:
+            base_schedules[municipality] = {}
+            municipalities.append({"name": municipality, "areas": []})
+        base_schedules[municipality][area] = next(templates)
+        municipalities[-1]["areas"].append(area)
+    return municipalities, base_schedules
+
+
+def load_dataset(municipalities: List[Dict], base_schedules: Dict) -> None:
+    """Point the app at a dataset and rebuild the schedule store"""
+    schedule_app.schedule_store = schedule_app.ScheduleStore(
+        InMemoryDataset(municipalities, base_schedules),
+        LocalStatusState(schedule_app.current_economic_status),
+        OverrideStore())
+
+
+def measure(func: Callable[[], object], repeat: int) -> Optional[Dict[str, float]]:
+    """Time repeated calls, returning per-call statistics in seconds"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            func()
+        except TemplateNotFound:
+            return None
+        timings.append(time.perf_counter() - started)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+    }
+
+
+def run_cases(area_count: Optional[int], repeat: int) -> Dict[str, Optional[Dict[str, float]]]:
+    """Run every benchmark case against a synthetic dataset of the given size, or the built-in one for None"""
+    original_store = schedule_app.schedule_store
+    if area_count is None:
+        municipalities, base_schedules = schedule_app.MUNICIPALITIES, schedule_app.BASE_SCHEDULES
+    else:
+        municipalities, base_schedules = synthetic_dataset(area_count)
+
+    results = {}
+    original_rate = schedule_app.write_limiter.rate
+    # Repeated write cases measure the write, not the rate limiter
+    schedule_app.write_limiter.rate = 0
+    try:
+        started = time.perf_counter()
+        load_dataset(municipalities, base_schedules)
+        elapsed = time.perf_counter() - started
+        results["compile_store"] = {"min": elapsed, "median": elapsed, "max": elapsed}
+
+        # A worker booting from a prebuilt snapshot of the same dataset
+        dataset = schedule_app.schedule_store.dataset
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot_path = os.path.join(directory, "compiled.snap")
+            schedule_app.build_snapshot_file(snapshot_path, dataset)
+            results["load_store (snapshot)"] = measure(
+                lambda: schedule_app.ScheduleStore(
+                    dataset, LocalStatusState(schedule_app.current_economic_status), OverrideStore(),
+                    snapshot=load_snapshot(snapshot_path)),
+                min(repeat, 20))
+
+        municipality = municipalities[0]["name"]
+        area = municipalities[0]["areas"][0]
+        # Testing mode propagates exceptions, so a missing template is skipped
+        # instead of timing the error page
+        schedule_app.app.testing = True
+        client = schedule_app.app.test_client()
+        regeneration_repeat = max(1, min(repeat, 200_000 // len(dataset.scheduled_areas())))
+
+        results["generate_schedule_for_area"] = measure(
+            lambda: schedule_app.generate_schedule_for_area(municipality, area, "critical"), repeat)
+        results["compile_schedules"] = measure(
+            lambda: schedule_app.compile_schedules("critical"), regeneration_repeat)
+        results["get_current_schedules"] = measure(schedule_app.get_current_schedules, repeat)
+        results["get_current_power_status"] = measure(
+            lambda: schedule_app.get_current_power_status(municipality, area), repeat)
+        results["GET /api/schedule"] = measure(
+            lambda: client.get(f"/api/schedule/{municipality}/{area}"), repeat)
+        results["search (prefix)"] = measure(lambda: schedule_app.schedule_store.names.search(area[:3]), repeat)
+        # A transposition, so only the trigram index can find it
+        misspelt = area[:1] + area[2] + area[1] + area[3:]
+        results["search (typo)"] = measure(lambda: schedule_app.schedule_store.names.search(misspelt), repeat)
+        results["GET /schedule"] = measure(
+            lambda: client.get("/schedule", query_string={"municipality": municipality, "area": area}),
+            repeat)
+
+        # Overlapping outages on one area, hour by hour over the coming weeks
+        now = schedule_app.clock.now().replace(second=0, microsecond=0)
+        schedule_app.schedule_store.override_store.add([
+            (municipality, area, (now + datetime.timedelta(hours=hour)).timestamp(),
+             (now + datetime.timedelta(hours=hour + 3)).timestamp(), "Power off", "benchmark")
+            for hour in range(OVERRIDE_EVENTS)
+        ])
+        schedule_app.schedule_store.reload_overrides()
+        moment = now + datetime.timedelta(hours=OVERRIDE_EVENTS // 2, minutes=30)
+        results["get_power_status_at (overrides)"] = measure(
+            lambda: schedule_app.get_power_status_at(municipality, area, moment), repeat)
+        other_area = municipalities[-1]["areas"][-1]
+        event = {"municipality": municipalities[-1]["name"], "area": other_area,
+                 "start": now.isoformat(), "end": (now + datetime.timedelta(hours=1)).isoformat()}
+        results["POST /api/overrides"] = measure(
+            lambda: client.post("/api/overrides", json={"events": [event]}), repeat)
+    finally:
+        schedule_app.schedule_store = original_store
+        schedule_app.write_limiter.rate = original_rate
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """List the cases whose median regressed beyond the tolerance"""
+    regressions = []
+    for size, cases in results.items():
+        for case, timing in cases.items():
+            reference = baseline.get(size, {}).get(case)
+            if not timing or not reference:
+                continue
+            limit = reference["median"] * (1 + tolerance)
+            if timing["median"] > limit:
+                regressions.append(
+                    f"{case} @ {size if size == BUILTIN_SIZE else f'{size} areas'}: {timing['median'] * 1e3:.3f} ms "
+                    f"(baseline {reference['median'] * 1e3:.3f} ms, limit {limit * 1e3:.3f} ms)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=f"{BUILTIN_SIZE},10000",
+                        help=f"comma separated area counts, '{BUILTIN_SIZE}' for the built-in dataset "
+                             f"(default: {BUILTIN_SIZE},10000)")
+    parser.add_argument("--repeat", type=int, default=200, help="calls per case (default: 200)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="write results as the baseline")
+    parser.add_argument("--check", action="store_true", help="fail if results regress against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown over the baseline median (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    sizes = [value.strip() for value in args.sizes.split(",")]
+    if not all(size == BUILTIN_SIZE or size.isdigit() for size in sizes):
+        parser.error(f"--sizes takes area counts and '{BUILTIN_SIZE}'")
+
+    results = {}
+    for size in sizes:
+        results[size] = run_cases(None if size == BUILTIN_SIZE else int(size), args.repeat)
+        label = size if size == BUILTIN_SIZE else f"{size} areas"
+        for case, timing in results[size].items():
+            if timing is None:
+                print(f"{label:>13}  {case:<28} skipped (template not found)")
+            else:
+                print(f"{label:>13}  {case:<28} median {timing['median'] * 1e3:10.3f} ms")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+iCalendar (RFC 5545) feeds of an area's outages, for calendar apps to
+subscribe to at /api/calendar/<municipality>/<area>.ics.
+
+A feed holds one daily recurring event per "Power off" slot of the area's
+compiled schedule and a one-off event per override of the area, so it stays
+small however long the app keeps it, and is refetched every CALENDAR_REFRESH.
+"""
+import datetime
+import hashlib
+from typing import Dict, Iterable, List
+
+from dataset import MINUTES_PER_DAY, Slot
+from overrides import OverrideEvent
+
+CALENDAR_PRODID = "-//Angola Loadshedding Tracker//Power Schedules//EN"
+CALENDAR_UID_DOMAIN = "loadshedding-tracker.ao"
+# How often subscribed calendar apps are asked to fetch the feed again
+CALENDAR_REFRESH = "PT1H"
+
+ICS_LOCAL_TIME = "%Y%m%dT%H%M%S"
+ICS_UTC_TIME = "%Y%m%dT%H%M%SZ"
+
+
+def ics_text(value: str) -> str:
+    """Escape an iCalendar TEXT value (RFC 5545 3.3.11)"""
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def ics_lines(lines: List[str]) -> bytes:
+    """Content lines joined with CRLF, folded at 75 octets without splitting a character"""
+    folded = []
+    for line in lines:
+        encoded = line.encode()
+        while len(encoded) > 75:
+            cut = 75
+            while encoded[cut] & 0xC0 == 0x80:
+                cut -= 1
+            folded.append(encoded[:cut])
+            encoded = b" " + encoded[cut:]
+        folded.append(encoded)
+    return b"\r\n".join(folded) + b"\r\n"
+
+
+def ics_utc_time(timestamp: float) -> str:
+    """A UNIX time as an iCalendar UTC DATE-TIME"""
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(ICS_UTC_TIME)
+
+
+def ics_timezone(zone: datetime.tzinfo, moment: datetime.datetime) -> List[str]:
+    """
+    VTIMEZONE of the schedule zone, as its UTC offset at a moment. That is
+    exact for zones without daylight saving time such as Africa/Luanda;
+    calendar apps resolve well-known TZIDs by name regardless.
+    """
+    minutes = int(zone.utcoffset(moment).total_seconds()) // 60
+    offset = f"{'-' if minutes < 0 else '+'}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}"
+    return [
+        "BEGIN:VTIMEZONE",
+        f"TZID:{zone}",
+        "BEGIN:STANDARD",
+        "DTSTART:19700101T000000",
+        f"TZOFFSETFROM:{offset}",
+        f"TZOFFSETTO:{offset}",
+        "END:STANDARD",
+        "END:VTIMEZONE",
+    ]
+
+
+def build_area_calendar(municipality: str, area: str, schedule: List[Dict],
+                        override_events: Iterable[OverrideEvent], economic_status: str,
+                        zone: datetime.tzinfo, today: datetime.date, changed_at: float) -> bytes:
+    """
+    iCalendar feed of an area's outages: one event per "Power off" slot of
+    its compiled schedule, repeating daily from `today` (RRULE, not one event
+    per day), plus a one-off event per override event of the area.
+    `economic_status` is the display name of the status the schedule is for
+    and `changed_at` when it took effect (UNIX seconds).
+    """
+    midnight = datetime.datetime.combine(today, datetime.time())
+    stamp = ics_utc_time(changed_at)
+    # Event UIDs stay stable across generations, so apps move events instead of duplicating them
+    uid_prefix = hashlib.sha1(f"{municipality}/{area}".encode()).hexdigest()[:16]
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{CALENDAR_PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{ics_text(f'Power outages - {area}, {municipality}')}",
+        f"X-WR-TIMEZONE:{zone}",
+        f"REFRESH-INTERVAL;VALUE=DURATION:{CALENDAR_REFRESH}",
+        f"X-PUBLISHED-TTL:{CALENDAR_REFRESH}",
+    ]
+    lines.extend(ics_timezone(zone, midnight))
+
+    description = ics_text(f"Scheduled load shedding ({economic_status} economic status)")
+    for number, slot in enumerate(schedule):
+        if slot["status"] != "Power off":
+            continue
+        outage = Slot.from_dict(slot)
+        start, end = outage.start, outage.end
+        if end <= start:
+            end += MINUTES_PER_DAY  # Crosses midnight
+        lines.extend([
+            "BEGIN:VEVENT",
+            f"UID:{uid_prefix}-{number}@{CALENDAR_UID_DOMAIN}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART;TZID={zone}:{(midnight + datetime.timedelta(minutes=start)).strftime(ICS_LOCAL_TIME)}",
+            f"DTEND;TZID={zone}:{(midnight + datetime.timedelta(minutes=end)).strftime(ICS_LOCAL_TIME)}",
+            "RRULE:FREQ=DAILY",
+            "SUMMARY:Power off",
+            f"DESCRIPTION:{description}",
+            "END:VEVENT",
+        ])
+
+    for event in override_events:
+        lines.extend([
+            "BEGIN:VEVENT",
+            f"UID:override-{event.id}@{CALENDAR_UID_DOMAIN}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{ics_utc_time(event.start)}",
+            f"DTEND:{ics_utc_time(event.end)}",
+            f"SUMMARY:{ics_text(event.status + ' (unscheduled)')}",
+            f"DESCRIPTION:{ics_text(event.reason or 'Schedule override')}",
+            "END:VEVENT",
+        ])
+
+    lines.append("END:VCALENDAR")
+    return ics_lines(lines)
@@ -0,0 +1,114 @@
+"""
+Clocks the schedules are evaluated against.
+
+Schedules are wall-clock times in one zone (SCHEDULE_TIMEZONE, Africa/Luanda
+by default), whatever zone the server runs in. Every route asks the app's
+clock for the current time, so load tests can pin it to a moment or run it
+faster than real time, either in process (`app.clock = FrozenClock(...)`) or
+for a whole server through SCHEDULE_CLOCK:
+
+    SCHEDULE_CLOCK=frozen:2025-06-02T17:55         # always that moment
+    SCHEDULE_CLOCK=accelerated:100                 # 100x speed from now
+    SCHEDULE_CLOCK=accelerated:100@2025-06-02      # 100x speed from that moment
+"""
+import datetime
+import os
+import time
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+DEFAULT_TIMEZONE = "Africa/Luanda"
+
+
+class Clock:
+    """Current time in the schedule zone"""
+
+    # Clock seconds that pass per real second (0 for a clock that stands still)
+    rate = 1.0
+
+    def __init__(self, timezone: datetime.tzinfo):
+        self.timezone = timezone
+
+    def now(self) -> datetime.datetime:
+        raise NotImplementedError
+
+    def localize(self, moment: datetime.datetime) -> datetime.datetime:
+        """A moment in the schedule zone; naive moments are taken to already be in it"""
+        if moment.tzinfo is None:
+            return moment.replace(tzinfo=self.timezone)
+        return moment.astimezone(self.timezone)
+
+    def parse(self, timestamp: str) -> datetime.datetime:
+        """Parse an ISO 8601 timestamp into the schedule zone (raises ValueError)"""
+        return self.localize(datetime.datetime.fromisoformat(timestamp))
+
+    def real_seconds(self, clock_seconds: float) -> Optional[float]:
+        """Real time until this clock has advanced by clock_seconds (None if it never will)"""
+        if not self.rate:
+            return None
+        return clock_seconds / self.rate
+
+
+class SystemClock(Clock):
+    """The real time"""
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(self.timezone)
+
+
+class FrozenClock(Clock):
+    """Always returns the same moment; move it with set()"""
+
+    rate = 0.0
+
+    def __init__(self, moment: datetime.datetime, timezone: datetime.tzinfo):
+        super().__init__(timezone)
+        self.set(moment)
+
+    def set(self, moment: datetime.datetime) -> None:
+        self.moment = self.localize(moment)
+
+    def now(self) -> datetime.datetime:
+        return self.moment
+
+
+class AcceleratedClock(Clock):
+    """Starts at a moment and runs `rate` times faster than real time"""
+
+    def __init__(self, start: datetime.datetime, rate: float, timezone: datetime.tzinfo):
+        super().__init__(timezone)
+        if rate <= 0:
+            raise ValueError("An accelerated clock needs a positive rate")
+        self.start = self.localize(start)
+        self.rate = rate
+        self._started = time.monotonic()
+
+    def now(self) -> datetime.datetime:
+        elapsed = (time.monotonic() - self._started) * self.rate
+        return self.start + datetime.timedelta(seconds=elapsed)
+
+
+def minute_of_day(moment: datetime.datetime) -> int:
+    """Minutes elapsed since midnight for a datetime"""
+    return moment.hour * 60 + moment.minute
+
+
+def load_clock(spec: Optional[str] = None, timezone: Optional[str] = None) -> Clock:
+    """
+    The clock described by `spec` (see the module docstring) in the given IANA
+    zone. Both default to the SCHEDULE_CLOCK and SCHEDULE_TIMEZONE environment
+    variables; without them this is the system clock in Africa/Luanda.
+    """
+    zone = ZoneInfo(timezone or os.environ.get("SCHEDULE_TIMEZONE") or DEFAULT_TIMEZONE)
+    spec = spec if spec is not None else os.environ.get("SCHEDULE_CLOCK", "")
+    kind, _, argument = spec.partition(":")
+
+    if kind in ("", "system"):
+        return SystemClock(zone)
+    if kind == "frozen":
+        return FrozenClock(datetime.datetime.fromisoformat(argument), zone)
+    if kind == "accelerated":
+        rate, _, start = argument.partition("@")
+        start_moment = datetime.datetime.fromisoformat(start) if start else datetime.datetime.now(zone)
+        return AcceleratedClock(start_moment, float(rate), zone)
+    raise ValueError(f"Unknown SCHEDULE_CLOCK {spec!r}; use system, frozen:<time> or accelerated:<rate>[@<time>]")
@@ -0,0 +1,292 @@
+"""
+Schedule datasets: the municipalities, areas and base slots schedules are
+generated from.
+
+The built-in dataset wraps the literals in app.py. A SQLite dataset can be
+exported from it (`flask --app app export-dataset schedules.db`) and served
+instead by setting SCHEDULE_DATASET=schedules.db. SQLite datasets load each
+area's slots lazily on first request and hot-reload when the file changes.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+# How often a file-backed dataset checks whether it changed on disk (seconds)
+RELOAD_CHECK_INTERVAL = float(os.environ.get("SCHEDULE_DATASET_RELOAD_INTERVAL", "2"))
+
+
+class Slot:
+    """One base schedule slot, stored as minutes since midnight"""
+
+    __slots__ = ("start", "end", "power_on")
+
+    def __init__(self, start: int, end: int, power_on: bool):
+        self.start = start
+        self.end = end
+        self.power_on = power_on
+
+    @property
+    def duration(self) -> int:
+        """Length of the slot in minutes (a slot ending at its start spans 24h)"""
+        return (self.end - self.start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+
+    @property
+    def status(self) -> str:
+        return "Power on" if self.power_on else "Power off"
+
+    @classmethod
+    def from_dict(cls, slot: Dict) -> "Slot":
+        start_hours, start_minutes = map(int, slot["start"].split(":"))
+        end_hours, end_minutes = map(int, slot["end"].split(":"))
+        return cls(start_hours * 60 + start_minutes, end_hours * 60 + end_minutes,
+                   slot["status"] == "Power on")
+
+
+class ScheduleDataset:
+    """Read-only view of municipalities, areas and their base slots"""
+
+    def __init__(self):
+        # Identifies the loaded data (the same in every worker serving it) and
+        # when it last changed, as a UNIX timestamp
+        self.version = 0
+        self.modified_at = time.time()
+
+    def municipalities(self) -> List[Dict]:
+        """Municipalities in display order, as {"name": ..., "areas": [...]}"""
+        raise NotImplementedError
+
+    def scheduled_areas(self) -> List[Tuple[str, str]]:
+        """(municipality, area) pairs that have a base schedule"""
+        raise NotImplementedError
+
+    def slots(self, municipality: str, area: str) -> Optional[Tuple[Slot, ...]]:
+        """Base slots of an area, or None if the area has no schedule"""
+        raise NotImplementedError
+
+    def area_names(self, municipality: str) -> List[str]:
+        """Areas of a municipality (empty if the municipality is unknown)"""
+        raise NotImplementedError
+
+    def reload_if_changed(self) -> bool:
+        """Pick up changes from the backing store; returns True if it changed"""
+        return False
+
+    def fingerprint(self) -> str:
+        """Identifies the loaded data for compiled snapshots; changes whenever the data does"""
+        raise NotImplementedError
+
+
+class InMemoryDataset(ScheduleDataset):
+    """Dataset built from MUNICIPALITIES / BASE_SCHEDULES style literals"""
+
+    def __init__(self, municipalities: List[Dict], base_schedules: Dict[str, Dict[str, List[Dict]]]):
+        super().__init__()
+        self._municipalities = municipalities
+        self._area_names = {muni["name"]: muni["areas"] for muni in municipalities}
+        self._scheduled_areas = [
+            (municipality, area)
+            for municipality, areas in base_schedules.items()
+            for area in areas
+        ]
+        self._slots = {
+            (municipality, area): tuple(Slot.from_dict(slot) for slot in slots)
+            for municipality, areas in base_schedules.items()
+            for area, slots in areas.items()
+        }
+
+    def municipalities(self) -> List[Dict]:
+        return self._municipalities
+
+    def scheduled_areas(self) -> List[Tuple[str, str]]:
+        return self._scheduled_areas
+
+    def area_names(self, municipality: str) -> List[str]:
+        return self._area_names.get(municipality, [])
+
+    def slots(self, municipality: str, area: str) -> Optional[Tuple[Slot, ...]]:
+        return self._slots.get((municipality, area))
+
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for key, area_slots in self._slots.items():
+            digest.update(repr((key, [(slot.start, slot.end, slot.power_on) for slot in area_slots])).encode())
+        return f"memory:{digest.hexdigest()}"
+
+
+class _LoadedNames(NamedTuple):
+    """Names read from a SQLite dataset, swapped in as one unit on reload"""
+    municipalities: List[Dict]
+    area_names: Dict[str, List[str]]
+    known_areas: Set[Tuple[str, str]]
+    scheduled_areas: List[Tuple[str, str]]
+    slot_cache: Dict[Tuple[str, str], Optional[Tuple[Slot, ...]]]
+
+
+SCHEMA = """
+CREATE TABLE municipalities (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE areas (
+    id INTEGER PRIMARY KEY,
+    municipality_id INTEGER NOT NULL REFERENCES municipalities (id),
+    name TEXT NOT NULL,
+    UNIQUE (municipality_id, name)
+);
+CREATE TABLE slots (
+    area_id INTEGER NOT NULL REFERENCES areas (id),
+    position INTEGER NOT NULL,
+    start_minute INTEGER NOT NULL,
+    end_minute INTEGER NOT NULL,
+    power_on INTEGER NOT NULL,
+    PRIMARY KEY (area_id, position)
+);
+"""
+
+
+class SQLiteDataset(ScheduleDataset):
+    """
+    Dataset stored in a SQLite file. Municipality and area names are read up
+    front; an area's slots are only read the first time they are requested.
+    The file's modification time is checked at most every
+    RELOAD_CHECK_INTERVAL seconds and the dataset reloads when it changes.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._load()
+
+    def _query(self, sql: str, parameters: Tuple = ()) -> List[Tuple]:
+        with closing(sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)) as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+    def _load(self) -> None:
+        self._stamp = self._file_stamp()
+        self.version = self._stamp[0]
+        self.modified_at = self._stamp[0] / 1e9
+        rows = self._query(
+            "SELECT m.name, a.name, EXISTS (SELECT 1 FROM slots s WHERE s.area_id = a.id) "
+            "FROM municipalities m JOIN areas a ON a.municipality_id = m.id "
+            "ORDER BY m.id, a.id"
+        )
+        municipalities = []
+        area_names = {}
+        known_areas = set()
+        scheduled_areas = []
+        for municipality, area, has_slots in rows:
+            if not municipalities or municipalities[-1]["name"] != municipality:
+                municipalities.append({"name": municipality, "areas": []})
+                area_names[municipality] = municipalities[-1]["areas"]
+            municipalities[-1]["areas"].append(area)
+            known_areas.add((municipality, area))
+            if has_slots:
+                scheduled_areas.append((municipality, area))
+
+        # Swapped in one assignment so readers never mix old and new data
+        self._names = _LoadedNames(municipalities, area_names, known_areas, scheduled_areas, {})
+
+    def _file_stamp(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def fingerprint(self) -> str:
+        # Any write to the file changes its modification time
+        return "sqlite:{}:{}".format(*self._stamp)
+
+    def municipalities(self) -> List[Dict]:
+        return self._names.municipalities
+
+    def scheduled_areas(self) -> List[Tuple[str, str]]:
+        return self._names.scheduled_areas
+
+    def area_names(self, municipality: str) -> List[str]:
+        return self._names.area_names.get(municipality, [])
+
+    def slots(self, municipality: str, area: str) -> Optional[Tuple[Slot, ...]]:
+        names = self._names
+        key = (municipality, area)
+        if key in names.slot_cache:
+            return names.slot_cache[key]
+
+        area_slots = None
+        if key in names.known_areas:
+            rows = self._query(
+                "SELECT s.start_minute, s.end_minute, s.power_on FROM slots s "
+                "JOIN areas a ON a.id = s.area_id JOIN municipalities m ON m.id = a.municipality_id "
+                "WHERE m.name = ? AND a.name = ? ORDER BY s.position", key
+            )
+            if rows:
+                area_slots = tuple(Slot(start, end, bool(power_on)) for start, end, power_on in rows)
+
+        names.slot_cache[key] = area_slots
+        return area_slots
+
+    def reload_if_changed(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        with self._lock:
+            if now < self._next_check:
+                return False
+            self._next_check = now + RELOAD_CHECK_INTERVAL
+            try:
+                if self._file_stamp() == self._stamp:
+                    return False
+                self._load()
+            except (OSError, sqlite3.Error):
+                # Keep serving the last good copy while the file is being replaced
+                return False
+            return True
+
+
+def export_sqlite(path: str, municipalities: List[Dict],
+                  base_schedules: Dict[str, Dict[str, List[Dict]]]) -> None:
+    """Write MUNICIPALITIES / BASE_SCHEDULES style data to a new SQLite file"""
+    # Areas that only appear in one of the two sources are kept as well
+    names = [(muni["name"], list(muni["areas"])) for muni in municipalities]
+    for municipality, areas in base_schedules.items():
+        listed = next((listed for name, listed in names if name == municipality), None)
+        if listed is None:
+            listed = []
+            names.append((municipality, listed))
+        listed.extend(area for area in areas if area not in listed)
+
+    temporary_path = f"{path}.tmp"
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+    with closing(sqlite3.connect(temporary_path)) as connection, connection:
+        connection.executescript(SCHEMA)
+        for municipality, areas in names:
+            municipality_id = connection.execute(
+                "INSERT INTO municipalities (name) VALUES (?)", (municipality,)).lastrowid
+            for area in areas:
+                area_id = connection.execute(
+                    "INSERT INTO areas (municipality_id, name) VALUES (?, ?)",
+                    (municipality_id, area)).lastrowid
+                connection.executemany(
+                    "INSERT INTO slots (area_id, position, start_minute, end_minute, power_on) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (area_id, position, slot.start, slot.end, int(slot.power_on))
+                        for position, slot in enumerate(
+                            Slot.from_dict(slot) for slot in base_schedules.get(municipality, {}).get(area, []))
+                    ])
+    # Replace atomically so running workers never read a half-written file
+    os.replace(temporary_path, path)
+
+
+def load_dataset(path: Optional[str], municipalities: List[Dict],
+                 base_schedules: Dict[str, Dict[str, List[Dict]]]) -> ScheduleDataset:
+    """The SQLite dataset at `path` if given, otherwise the built-in literals"""
+    if path:
+        return SQLiteDataset(path)
+    return InMemoryDataset(municipalities, base_schedules)
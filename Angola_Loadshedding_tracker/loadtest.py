@@ -0,0 +1,397 @@
+"""
+Load test the app over HTTP with a production-like mix of requests.
+
+Starts gunicorn on localhost (or targets a running server with --url),
+replays a weighted mix of routes from many keep-alive connections and
+reports throughput and latency percentiles per route. The report is JSON,
+so runs can be compared, and the run fails when a latency SLO is missed or
+a baseline regresses:
+
+    python loadtest.py --workers 4 --connections 64 --duration 30 --report load.json
+    python loadtest.py --url http://127.0.0.1:5000 --rate 500 --check --baseline load.json
+
+Without --rate every connection sends its next request as soon as the last
+one is answered (closed loop). With --rate requests are sent on a fixed
+schedule and latency is measured from the moment each request was due, so
+a stalled server shows up as latency instead of as fewer requests.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urlsplit
+
+DEFAULT_MIX = "api_schedule=90,schedule_page=9,economic_status=1"
+
+# Route -> thresholds; "total" applies to every request together
+DEFAULT_SLOS = {
+    "api_schedule": {"p50_ms": 10, "p99_ms": 50},
+    "schedule_page": {"p50_ms": 25, "p99_ms": 150},
+    "economic_status": {"p50_ms": 50, "p99_ms": 500},
+    "total": {"max_error_rate": 0.001},
+}
+
+STARTUP_TIMEOUT = 30.0
+
+# (method, path, JSON body or None) of one request
+Request = Tuple[str, str, Optional[bytes]]
+
+
+def route_builders(areas: List[Tuple[str, str]], statuses: List[str],
+                   rng: random.Random) -> Dict[str, Callable[[], Request]]:
+    """A function per route name that makes a random request to that route"""
+    def area_path() -> Tuple[str, str]:
+        return rng.choice(areas)
+
+    def api_schedule() -> Request:
+        municipality, area = area_path()
+        return "GET", f"/api/schedule/{quote(municipality)}/{quote(area)}", None
+
+    def schedule_page() -> Request:
+        municipality, area = area_path()
+        return "GET", "/schedule?" + urlencode({"municipality": municipality, "area": area}), None
+
+    def economic_status() -> Request:
+        return "POST", "/api/economic-status", json.dumps({"status": rng.choice(statuses)}).encode()
+
+    return {
+        "api_schedule": api_schedule,
+        "schedule_page": schedule_page,
+        "economic_status": economic_status,
+    }
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "route=weight,route=weight" into weights"""
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class Connection:
+    """One HTTP/1.1 keep-alive connection; reconnects when the server closes it"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[bytes]) -> int:
+        """Send a request and read the whole response; returns the status code"""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        if body is not None:
+            head += f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+        self._writer.write(head.encode("latin-1") + b"\r\n" + (body or b""))
+        try:
+            await self._writer.drain()
+            return await self._read_response()
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            raise
+
+    async def _read_response(self) -> int:
+        status_line = await self._reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if "content-length" in headers:
+            await self._reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                await self._reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self._reader.read()
+            headers["connection"] = "close"
+
+        if headers.get("connection") == "close" or status_line.startswith(b"HTTP/1.0"):
+            self.close()
+        return status
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class Recorder:
+    """Latencies (seconds) and error counts per route"""
+
+    def __init__(self, routes: List[str]):
+        self.latencies: Dict[str, List[float]] = {route: [] for route in routes}
+        self.errors: Dict[str, int] = {route: 0 for route in routes}
+
+    def record(self, route: str, latency: float, ok: bool) -> None:
+        self.latencies[route].append(latency)
+        if not ok:
+            self.errors[route] += 1
+
+
+async def run_load(base_url: str, builders: Dict[str, Callable[[], Request]], mix: Dict[str, float],
+                   connections: int, duration: float, warmup: float, rate: float,
+                   rng: random.Random) -> Tuple[Recorder, float]:
+    """Drive the server for warmup + duration seconds; returns the recorder and the measured seconds"""
+    url = urlsplit(base_url)
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    recorder = Recorder(routes)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+    sent = 0
+
+    async def client() -> None:
+        nonlocal sent
+        connection = Connection(url.hostname, url.port or 80)
+        try:
+            while True:
+                if rate:
+                    # Open loop: take the next slot of the shared schedule
+                    due = started + sent / rate
+                    sent += 1
+                    if due >= stop_at:
+                        return
+                    await asyncio.sleep(max(0.0, due - loop.time()))
+                else:
+                    due = loop.time()
+                    if due >= stop_at:
+                        return
+                route = rng.choices(routes, weights)[0]
+                method, path, body = builders[route]()
+                try:
+                    status = await connection.request(method, path, body)
+                    # 4xx (a 429 from the write limiter, say) means the request was not served either
+                    ok = status < 400
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    ok = False
+                if due >= measure_from:
+                    recorder.record(route, loop.time() - due, ok)
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return recorder, duration
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    # The smallest value with at least `fraction` of the values at or below it;
+    # rounding first keeps float error (0.07 * 100 = 7.000000000000001) from adding a rank
+    rank = math.ceil(round(fraction * len(ordered), 9)) - 1
+    return ordered[max(0, min(len(ordered) - 1, rank))]
+
+
+def summarize(latencies: List[float], errors: int, seconds: float) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "error_rate": errors / len(ordered) if ordered else 0.0,
+        "throughput": len(ordered) / seconds if seconds else 0.0,
+        "p50_ms": percentile(ordered, 0.50) * 1e3,
+        "p90_ms": percentile(ordered, 0.90) * 1e3,
+        "p99_ms": percentile(ordered, 0.99) * 1e3,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1e3,
+    }
+
+
+def build_report(recorder: Recorder, seconds: float, config: Dict) -> Dict:
+    routes = {
+        route: summarize(latencies, recorder.errors[route], seconds)
+        for route, latencies in recorder.latencies.items()
+    }
+    everything = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    total = summarize(everything, sum(recorder.errors.values()), seconds)
+    return {"config": config, "routes": routes, "total": total}
+
+
+def check_slos(report: Dict, slos: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    List every threshold the report misses. A report field (p99_ms) or
+    max_<field> is an upper bound, min_<field> (min_throughput) a lower one.
+    """
+    violations = []
+    for route, thresholds in slos.items():
+        result = report["total"] if route == "total" else report["routes"].get(route)
+        if not result or not result["requests"]:
+            continue
+        for metric, limit in thresholds.items():
+            if metric.startswith("min_") and metric not in result:
+                value = result[metric[len("min_"):]]
+                missed = value < limit
+            else:
+                value = result[metric if metric in result else metric[len("max_"):]]
+                missed = value > limit
+            if missed:
+                violations.append(f"{route} {metric}: {value:.3f} (SLO {limit})")
+    return violations
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """List the routes whose p50/p99 grew or whose throughput fell beyond the tolerance"""
+    regressions = []
+    for route, result in report["routes"].items():
+        reference = baseline.get("routes", {}).get(route)
+        if not reference or not result["requests"] or not reference["requests"]:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            limit = reference[metric] * (1 + tolerance)
+            if result[metric] > limit:
+                regressions.append(f"{route} {metric}: {result[metric]:.3f} ms "
+                                   f"(baseline {reference[metric]:.3f} ms, limit {limit:.3f} ms)")
+        floor = reference["throughput"] * (1 - tolerance)
+        if result["throughput"] < floor:
+            regressions.append(f"{route} throughput: {result['throughput']:.1f}/s "
+                               f"(baseline {reference['throughput']:.1f}/s, floor {floor:.1f}/s)")
+    return regressions
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"{base_url}/api/economic-status", timeout=1):
+                return
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.1)
+    raise RuntimeError(f"gunicorn did not answer within {timeout:.0f} s")
+
+
+@contextmanager
+def local_server(workers: int, worker_class: str, preload: bool) -> Iterator[str]:
+    """Run the app under gunicorn on a free localhost port for the duration of the block"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        # Workers must share the economic status the POSTs change
+        env.setdefault("SCHEDULE_STATE_FILE", os.path.join(directory, "state.bin"))
+        # Every client comes from 127.0.0.1, so the per-client write limit would throttle the whole mix
+        env.setdefault("SCHEDULE_WRITE_RATE", "0")
+        command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}",
+                   "--workers", str(workers), "--worker-class", worker_class, "--log-level", "warning"]
+        if preload:
+            command.append("--preload")
+        process = subprocess.Popen(command + ["app:app"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   env=env)
+        try:
+            wait_until_ready(base_url, process, STARTUP_TIMEOUT)
+            yield base_url
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def dataset_areas() -> Tuple[List[Tuple[str, str]], List[str]]:
+    """Scheduled areas and economic statuses of the dataset the server loads (same environment)"""
+    import app as schedule_app
+    return list(schedule_app.schedule_store.dataset.scheduled_areas()), list(schedule_app.ECONOMIC_STATUSES)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="load test a running server instead of starting gunicorn")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers (default: 4)")
+    parser.add_argument("--worker-class", default="sync", help="gunicorn worker class (default: sync)")
+    parser.add_argument("--no-preload", action="store_true", help="start gunicorn without --preload")
+    parser.add_argument("--connections", type=int, default=32, help="concurrent connections (default: 32)")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds (default: 20)")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds first (default: 3)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="requests per second on a fixed schedule (default: as fast as answered)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the request sequence (default: 0)")
+    parser.add_argument("--slo", help="JSON file of per-route thresholds replacing the defaults")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--check", action="store_true", help="fail if results regress against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed change against the baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+    if args.check and not args.baseline:
+        parser.error("--check needs --baseline")
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    areas, statuses = dataset_areas()
+    builders = route_builders(areas, statuses, rng)
+    unknown = set(mix) - set(builders)
+    if unknown:
+        parser.error(f"unknown routes in --mix: {', '.join(sorted(unknown))} (known: {', '.join(builders)})")
+
+    slos = DEFAULT_SLOS
+    if args.slo:
+        with open(args.slo) as slo_file:
+            slos = json.load(slo_file)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("report", "baseline", "check")}
+    if args.url:
+        server = nullcontext(args.url.rstrip("/"))
+    else:
+        server = local_server(args.workers, args.worker_class, not args.no_preload)
+    with server as base_url:
+        recorder, seconds = asyncio.run(run_load(
+            base_url, builders, mix, args.connections, args.duration, args.warmup, args.rate, rng))
+    report = build_report(recorder, seconds, config)
+
+    for route, result in [*report["routes"].items(), ("total", report["total"])]:
+        print(f"{route:<16} {result['requests']:>8} req {result['throughput']:9.1f}/s  "
+              f"p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+              f"errors {result['errors']}")
+
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f"Report written to {args.report}")
+
+    failures = [f"SLO: {violation}" for violation in check_slos(report, slos)]
+    if args.check:
+        with open(args.baseline) as baseline_file:
+            failures += [f"REGRESSION: {regression}"
+                         for regression in compare(report, json.load(baseline_file), args.tolerance)]
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
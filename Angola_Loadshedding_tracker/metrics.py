@@ -0,0 +1,222 @@
+"""
+In-process metrics in the Prometheus text format, and an optional profiler.
+
+Counters and histograms are plain Python objects guarded by a lock, cheap
+enough to update on every request. `/metrics` renders the registry; under
+gunicorn each worker keeps and reports its own numbers, so scrape the
+workers individually or aggregate them in Prometheus.
+
+Setting SCHEDULE_PROFILE_REQUESTS=N profiles N requests with cProfile and
+writes their combined stats to SCHEDULE_PROFILE_FILE (requests.prof by
+default), readable with `python -m pstats`. SCHEDULE_PROFILE_EVERY=K
+samples only one request in every K, to spread the profile over more traffic.
+"""
+import bisect
+import cProfile
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the default latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named family of time series, one per combination of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """The series for these label values (keep the returned object to skip the lookup)"""
+        key = tuple(values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class CounterValue:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = "counter"
+
+    def _new_child(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1) -> None:
+        """Increment the unlabelled series"""
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(child.value)}"
+            for key, child in sorted(self._children.items())
+        ]
+
+
+class HistogramValue:
+    __slots__ = ("_lock", "buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot counts values above every bound
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """Record a value in the unlabelled series"""
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in sorted(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, f'le="{format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics exposed together on one /metrics page"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+class RequestProfiler:
+    """
+    Profiles a limited number of requests with cProfile and writes their
+    combined stats to a file once the last one finishes. Only one request is
+    profiled at a time; requests that arrive meanwhile simply run unprofiled.
+    """
+
+    def __init__(self, requests: int, path: str, every: int = 1):
+        self.remaining = requests
+        self.path = path
+        self.every = max(1, every)
+        self._seen = 0
+        self._busy = threading.Lock()
+        self._profile = cProfile.Profile()
+
+    @property
+    def enabled(self) -> bool:
+        return self.remaining > 0
+
+    def start(self) -> bool:
+        """Begin profiling the current request if it is sampled; True if it is"""
+        if self.remaining <= 0:
+            return False
+        self._seen += 1
+        if self._seen % self.every or not self._busy.acquire(blocking=False):
+            return False
+        self._profile.enable()
+        return True
+
+    def stop(self) -> None:
+        """Finish profiling the current request (only after start() returned True)"""
+        self._profile.disable()
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self._profile.dump_stats(self.path)
+        self._busy.release()
+
+
+def load_profiler() -> Optional[RequestProfiler]:
+    """The profiler configured by SCHEDULE_PROFILE_REQUESTS, or None when profiling is off"""
+    requests = int(os.environ.get("SCHEDULE_PROFILE_REQUESTS") or 0)
+    if requests <= 0:
+        return None
+    return RequestProfiler(
+        requests,
+        os.environ.get("SCHEDULE_PROFILE_FILE", "requests.prof"),
+        int(os.environ.get("SCHEDULE_PROFILE_EVERY") or 1)
+    )
@@ -0,0 +1,320 @@
+"""
+Schedule overrides: unplanned outages and manual changes layered on top of
+the generated schedules.
+
+An override event forces one area, or every area of a municipality, to a
+status between two moments. Events live in SQLite: a file shared by every
+worker when SCHEDULE_OVERRIDES is set, otherwise an in-memory database of
+this process. Each area's events are flattened into an OverrideTimeline of
+disjoint segments, so finding the override in effect at a moment is one
+bisect however many events overlap.
+
+Every write stamps the rows it touches with a new store revision, so a
+worker catches up by reading only the rows changed since the revision it
+holds, and rebuilds only the timelines of the areas those rows touch.
+"""
+import bisect
+import heapq
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from dataset import RELOAD_CHECK_INTERVAL
+
+OVERRIDE_STATUSES = ("Power on", "Power off")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    municipality TEXT NOT NULL,
+    area TEXT,
+    start_at REAL NOT NULL,
+    end_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    reason TEXT NOT NULL DEFAULT '',
+    revision INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_end_at ON events (end_at);
+CREATE INDEX IF NOT EXISTS events_revision ON events (revision);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0);
+"""
+
+EVENT_COLUMNS = "id, municipality, area, start_at, end_at, status, reason"
+
+
+class OverrideEvent(NamedTuple):
+    """One override; `area` is None for a municipality-wide event. Times are UNIX seconds"""
+    id: int
+    municipality: str
+    area: Optional[str]
+    start: float
+    end: float
+    status: str
+    reason: str
+
+
+class OverrideStore:
+    """
+    Override events in SQLite. The store revision increases with every write
+    and each row keeps the revision that last wrote it.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        # An in-memory database only exists while its connection is open
+        self._memory = None if path else sqlite3.connect(":memory:", check_same_thread=False)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        if self._memory is not None:
+            with self._lock, self._memory:
+                yield self._memory
+        else:
+            with closing(sqlite3.connect(self.path, timeout=10)) as connection, connection:
+                yield connection
+
+    @staticmethod
+    def _revision(connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    @staticmethod
+    def _bump(connection: sqlite3.Connection) -> int:
+        connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        return OverrideStore._revision(connection)
+
+    def events(self, now: float) -> Tuple[int, List[OverrideEvent]]:
+        """(store revision, events that have not ended yet)"""
+        with self._connect() as connection:
+            revision = self._revision(connection)
+            rows = connection.execute(
+                f"SELECT {EVENT_COLUMNS} FROM events WHERE end_at > ? AND end_at > start_at ORDER BY id",
+                (now,)).fetchall()
+        return revision, [OverrideEvent(*row) for row in rows]
+
+    def changes(self, since: int) -> Tuple[int, List[OverrideEvent]]:
+        """(store revision, events added or changed after revision `since`)"""
+        with self._connect() as connection:
+            revision = self._revision(connection)
+            rows = connection.execute(
+                f"SELECT {EVENT_COLUMNS} FROM events WHERE revision > ? ORDER BY id", (since,)).fetchall()
+        return revision, [OverrideEvent(*row) for row in rows]
+
+    def add(self, events: Sequence[Tuple[str, Optional[str], float, float, str, str]]) -> List[OverrideEvent]:
+        """Insert (municipality, area, start, end, status, reason) events in one transaction"""
+        with self._connect() as connection:
+            revision = self._bump(connection)
+            added = []
+            for municipality, area, start, end, status, reason in events:
+                event_id = connection.execute(
+                    "INSERT INTO events (municipality, area, start_at, end_at, status, reason, revision) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (municipality, area, start, end, status, reason, revision)).lastrowid
+                added.append(OverrideEvent(event_id, municipality, area, start, end, status, reason))
+        return added
+
+    def expire(self, now: float, ids: Optional[Iterable[int]] = None, municipality: Optional[str] = None,
+               area: Optional[str] = None) -> List[OverrideEvent]:
+        """
+        End events now: those with the given ids, or those of a municipality
+        (and area, if given). Events that had not started are cancelled.
+        Returns the expired events as they were before.
+        """
+        if ids is not None:
+            ids = list(ids)
+            where = f"id IN ({','.join('?' * len(ids))})"
+            parameters: List = ids
+        else:
+            where = "municipality = ?"
+            parameters = [municipality]
+            if area is not None:
+                where += " AND area = ?"
+                parameters.append(area)
+        where += " AND end_at > ? AND end_at > start_at"
+        parameters.append(now)
+
+        with self._connect() as connection:
+            rows = connection.execute(f"SELECT {EVENT_COLUMNS} FROM events WHERE {where}", parameters).fetchall()
+            if rows:
+                revision = self._bump(connection)
+                connection.executemany("UPDATE events SET end_at = ?, revision = ? WHERE id = ?",
+                                       [(now, revision, row[0]) for row in rows])
+        return [OverrideEvent(*row) for row in rows]
+
+    def changed_since(self, revision: int) -> bool:
+        """
+        Whether another worker wrote after `revision`, checked at most every
+        RELOAD_CHECK_INTERVAL seconds (an in-memory store has no other writers)
+        """
+        if self._memory is not None:
+            return False
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + RELOAD_CHECK_INTERVAL
+        try:
+            with self._connect() as connection:
+                return self._revision(connection) != revision
+        except sqlite3.Error:
+            return False
+
+
+class OverrideTimeline:
+    """
+    Overlapping events of one area flattened into disjoint segments:
+    `statuses[i]` is in effect from `boundaries[i]` until `boundaries[i + 1]`
+    (None where no event applies). Where events overlap the latest added wins.
+    """
+
+    __slots__ = ("boundaries", "statuses")
+
+    def __init__(self, events: Sequence[OverrideEvent]):
+        points = sorted({point for event in events for point in (event.start, event.end)})
+        by_start = sorted(events, key=lambda event: event.start)
+        active: List[Tuple[int, float, str]] = []  # Heap of (-id, end, status)
+        next_event = 0
+        self.boundaries: List[float] = []
+        self.statuses: List[Optional[str]] = []
+        for point in points:
+            while next_event < len(by_start) and by_start[next_event].start <= point:
+                event = by_start[next_event]
+                heapq.heappush(active, (-event.id, event.end, event.status))
+                next_event += 1
+            # Ended events below the top are dropped lazily, once they surface
+            while active and active[0][1] <= point:
+                heapq.heappop(active)
+            status = active[0][2] if active else None
+            if not self.statuses or status != self.statuses[-1]:
+                self.boundaries.append(point)
+                self.statuses.append(status)
+
+    def segment(self, timestamp: float) -> Tuple[Optional[float], Optional[str], Optional[float]]:
+        """(start, status, end) of the segment holding a moment; status None means no override"""
+        position = bisect.bisect_right(self.boundaries, timestamp) - 1
+        start = self.boundaries[position] if position >= 0 else None
+        status = self.statuses[position] if position >= 0 else None
+        end = self.boundaries[position + 1] if position + 1 < len(self.boundaries) else None
+        return start, status, end
+
+    def status_at(self, timestamp: float) -> Optional[str]:
+        position = bisect.bisect_right(self.boundaries, timestamp) - 1
+        return self.statuses[position] if position >= 0 else None
+
+
+class OverrideSet:
+    """
+    Immutable override timelines of every affected area at one store
+    revision, plus every moment an override starts or ends (for the
+    transition timer). updated() derives the next set, rebuilding only the
+    timelines of the areas whose events changed.
+    """
+
+    def __init__(self, areas_by_municipality: Dict[str, List[str]]):
+        self.revision = 0
+        self.areas_by_municipality = areas_by_municipality
+        self.events: Dict[int, OverrideEvent] = {}
+        self.timelines: Dict[Tuple[str, str], OverrideTimeline] = {}
+        self.changes: Dict[float, List[Tuple[str, str]]] = {}
+        self.change_times: List[float] = []
+        self.rebuilt = 0  # Timelines built by the update that produced this set
+        self._area_events: Dict[Tuple[str, str], List[OverrideEvent]] = {}
+
+    def _areas(self, event: OverrideEvent) -> List[Tuple[str, str]]:
+        if event.area is not None:
+            return [(event.municipality, event.area)]
+        return [(event.municipality, area) for area in self.areas_by_municipality.get(event.municipality, ())]
+
+    def updated(self, revision: int, changed: Sequence[OverrideEvent], now: float) -> "OverrideSet":
+        """The set after adding or replacing `changed` events; those ended by `now` are dropped"""
+        result = OverrideSet(self.areas_by_municipality)
+        result.revision = revision
+        result.events = dict(self.events)
+        result.timelines = dict(self.timelines)
+        result._area_events = dict(self._area_events)
+
+        affected = set()
+        changed_ids = set()
+        added: Dict[Tuple[str, str], List[OverrideEvent]] = {}
+        for event in changed:
+            changed_ids.add(event.id)
+            previous = result.events.pop(event.id, None)
+            if previous is not None:
+                affected.update(self._areas(previous))
+            if event.end > now and event.end > event.start:
+                result.events[event.id] = event
+                for key in self._areas(event):
+                    added.setdefault(key, []).append(event)
+                    affected.add(key)
+
+        changes = dict(self.changes)
+        change_times = list(self.change_times)
+        for key in affected:
+            old = result.timelines.pop(key, None)
+            if old is not None:
+                for boundary in old.boundaries:
+                    keys = [other for other in changes[boundary] if other != key]
+                    if keys:
+                        changes[boundary] = keys
+                    else:
+                        del changes[boundary]
+                        del change_times[bisect.bisect_left(change_times, boundary)]
+
+            area_events = [event for event in result._area_events.pop(key, ()) if event.id not in changed_ids]
+            area_events.extend(added.get(key, ()))
+            if not area_events:
+                continue
+            area_events.sort(key=lambda event: event.id)
+            result._area_events[key] = area_events
+            timeline = result.timelines[key] = OverrideTimeline(area_events)
+            result.rebuilt += 1
+            for boundary in timeline.boundaries:
+                if boundary in changes:
+                    changes[boundary] = changes[boundary] + [key]
+                else:
+                    changes[boundary] = [key]
+                    bisect.insort(change_times, boundary)
+
+        result.changes = changes
+        result.change_times = change_times
+        return result
+
+    def timeline(self, municipality: str, area: str) -> Optional[OverrideTimeline]:
+        return self.timelines.get((municipality, area))
+
+    def area_events(self, municipality: str, area: str) -> List[OverrideEvent]:
+        """The events applying to an area, its own and its municipality's"""
+        return self._area_events.get((municipality, area), [])
+
+    def status_at(self, municipality: str, area: str, timestamp: float) -> Optional[str]:
+        """The override status of an area at a moment, or None if no override applies"""
+        timeline = self.timelines.get((municipality, area))
+        return timeline.status_at(timestamp) if timeline is not None else None
+
+    def statuses_at(self, timestamp: float) -> Dict[Tuple[str, str], str]:
+        """The override status of every area an override applies to at a moment"""
+        statuses = {}
+        for key, timeline in self.timelines.items():
+            status = timeline.status_at(timestamp)
+            if status is not None:
+                statuses[key] = status
+        return statuses
+
+    def next_change_after(self, timestamp: float) -> Optional[float]:
+        """The first moment after `timestamp` at which any override starts or ends"""
+        position = bisect.bisect_right(self.change_times, timestamp)
+        return self.change_times[position] if position < len(self.change_times) else None
+
+
+def load_override_store(path: Optional[str] = None) -> OverrideStore:
+    """The override store at `path` (default SCHEDULE_OVERRIDES), in memory without one"""
+    return OverrideStore(path if path is not None else os.environ.get("SCHEDULE_OVERRIDES") or None)
@@ -0,0 +1,113 @@
+"""
+Economic status state shared between worker processes.
+
+Under gunicorn every worker has its own copy of the schedule store, so the
+active economic status has to live outside the processes. Setting
+SCHEDULE_STATE_FILE makes every worker map the same small file into memory:
+reading the status is a plain memory read (no IPC per request), and a
+POST to /api/economic-status in any worker is seen by all of them on their
+next request. Without it the status is kept in the process, which is fine
+for the development server.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+# Longest economic status key that fits in the shared file
+MAX_STATUS_LENGTH = 16
+
+
+class LocalStatusState:
+    """Economic status held by this process only"""
+
+    def __init__(self, default_status: str):
+        self._lock = threading.Lock()
+        self._state = (1, default_status, time.time())
+
+    def read(self) -> Tuple[int, str, float]:
+        """(status generation, economic status, UNIX time it was set)"""
+        return self._state
+
+    def publish(self, status: str) -> Tuple[int, str, float]:
+        """Set the economic status, bumping the generation if it changed"""
+        with self._lock:
+            generation, current, _ = self._state
+            if status != current:
+                self._state = (generation + 1, status, time.time())
+            return self._state
+
+
+class SharedStatusState:
+    """
+    Economic status stored in a memory-mapped file shared by every worker.
+
+    The file holds a sequence number, the status generation, the time the
+    status was set and the status key.
+    Writers take an exclusive lock on the file and make the sequence number odd
+    while they write, so readers never need a lock: they retry the (very rare)
+    read that overlaps a write.
+    """
+
+    LAYOUT = struct.Struct(f"<QQd{MAX_STATUS_LENGTH}s")
+
+    def __init__(self, path: str, default_status: str):
+        self.path = path
+        self._fd = -1
+        self._fd_pid = None
+        with self._exclusive():
+            if os.fstat(self._fd).st_size < self.LAYOUT.size:
+                os.ftruncate(self._fd, self.LAYOUT.size)
+                os.pwrite(self._fd, self.LAYOUT.pack(0, 1, time.time(), self._encode(default_status)), 0)
+        self._map = mmap.mmap(self._fd, self.LAYOUT.size)
+
+    @staticmethod
+    def _encode(status: str) -> bytes:
+        encoded = status.encode()
+        if len(encoded) > MAX_STATUS_LENGTH:
+            raise ValueError(f"Economic status key longer than {MAX_STATUS_LENGTH} bytes: {status!r}")
+        return encoded
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        # flock() locks belong to the open file, which forked workers would
+        # share, so every process locks through a descriptor of its own
+        if self._fd_pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._fd_pid = os.getpid()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def read(self) -> Tuple[int, str, float]:
+        """(status generation, economic status, UNIX time it was set)"""
+        while True:
+            sequence, generation, changed_at, status = self.LAYOUT.unpack_from(self._map)
+            if sequence % 2 == 0 and self.LAYOUT.unpack_from(self._map)[0] == sequence:
+                return generation, status.rstrip(b"\0").decode(), changed_at
+
+    def publish(self, status: str) -> Tuple[int, str, float]:
+        """Set the economic status for every worker, bumping the generation if it changed"""
+        encoded = self._encode(status)
+        with self._exclusive():
+            sequence, generation, changed_at, current = self.LAYOUT.unpack_from(self._map)
+            if current.rstrip(b"\0") == encoded:
+                return generation, status, changed_at
+            changed_at = time.time()
+            self.LAYOUT.pack_into(self._map, 0, sequence + 1, generation, changed_at, current)
+            self.LAYOUT.pack_into(self._map, 0, sequence + 1, generation + 1, changed_at, encoded)
+            self.LAYOUT.pack_into(self._map, 0, sequence + 2, generation + 1, changed_at, encoded)
+            return generation + 1, status, changed_at
+
+
+def load_status_state(path: Optional[str], default_status: str):
+    """Shared state backed by the file at `path` if given, otherwise process-local state"""
+    if path:
+        return SharedStatusState(path, default_status)
+    return LocalStatusState(default_status)
@@ -0,0 +1,174 @@
+"""
+Prebuilt snapshot of the compiled schedules of every economic status.
+
+`flask --app app build-snapshot compiled.snap` compiles every area under
+every economic status once and writes the result to a file; workers started
+with SCHEDULE_SNAPSHOT=compiled.snap map it instead of generating schedules.
+The interval arrays are read straight from the mapping (NumPy views or
+memoryviews, never copies), so every worker shares the same page-cache
+pages, and an area's schedule and index objects are only decoded when the
+area is first requested.
+
+Layout: an 8 byte magic, the header length (uint32), a JSON header and then
+8-byte aligned sections. Per economic status there are four arrays, all
+indexed by the area's position in the header's area list:
+
+    keys          int64  area position * 1440 + boundary minute, sorted
+    codes         int8   status code of each boundary
+    area_offsets  uint32 first entry of each area in keys/codes (+ the end)
+    json_offsets  uint64 start of each area's schedule JSON (+ the end)
+
+followed by the concatenated schedule JSON of every area.
+
+The header carries a fingerprint of the dataset and the status definitions
+the snapshot was built from; a snapshot whose fingerprint does not match is
+ignored and schedules are compiled as usual.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dataset import MINUTES_PER_DAY
+
+MAGIC = b"ENESNAP\0"
+# Bump whenever the layout or the way schedules are compiled changes
+FORMAT_VERSION = 1
+
+HEADER_LENGTH = struct.Struct("<I")
+ALIGNMENT = 8
+
+# (boundary minutes, status codes, schedule JSON) of one area
+SnapshotArea = Tuple[Sequence[int], Sequence[int], bytes]
+
+# Array type codes of the per-status sections
+SECTIONS = (("keys", "q"), ("codes", "b"), ("area_offsets", "I"), ("json_offsets", "Q"))
+
+
+def _pad(length: int) -> int:
+    return -length % ALIGNMENT
+
+
+def write_snapshot(path: str, fingerprint: str, areas: List[Tuple[str, str]],
+                   statuses: Dict[str, List[SnapshotArea]]) -> None:
+    """Write compiled areas (in the order of `areas`) for each economic status"""
+    blobs: List[bytes] = []
+    sections: Dict[str, Dict[str, List[int]]] = {}
+    offset = 0
+
+    def add(blob: bytes) -> List[int]:
+        nonlocal offset
+        placed = [offset, len(blob)]
+        blobs.append(blob + b"\0" * _pad(len(blob)))
+        offset += len(blob) + _pad(len(blob))
+        return placed
+
+    for status, compiled in statuses.items():
+        keys, codes = array("q"), array("b")
+        area_offsets, json_offsets = array("I", [0]), array("Q", [0])
+        schedule_json = []
+        json_length = 0
+        for position, (boundaries, status_codes, area_json) in enumerate(compiled):
+            keys.extend(position * MINUTES_PER_DAY + boundary for boundary in boundaries)
+            codes.extend(status_codes)
+            area_offsets.append(len(keys))
+            schedule_json.append(area_json)
+            json_length += len(area_json)
+            json_offsets.append(json_length)
+        sections[status] = {
+            "keys": add(keys.tobytes()),
+            "codes": add(codes.tobytes()),
+            "area_offsets": add(area_offsets.tobytes()),
+            "json_offsets": add(json_offsets.tobytes()),
+            "json": add(b"".join(schedule_json)),
+        }
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "fingerprint": fingerprint,
+        "areas": areas,
+        "statuses": sections,
+    }, separators=(",", ":")).encode()
+    prefix = MAGIC + HEADER_LENGTH.pack(len(header)) + header
+    prefix += b"\0" * _pad(len(prefix))
+
+    # Replace atomically; running workers keep their mapping of the old file
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as snapshot_file:
+        snapshot_file.write(prefix)
+        for blob in blobs:
+            snapshot_file.write(blob)
+    os.replace(temporary_path, path)
+
+
+class SnapshotStatus:
+    """The compiled arrays of one economic status, as views into the mapping"""
+
+    def __init__(self, snapshot: "CompiledSnapshot", sections: Dict[str, List[int]]):
+        self.snapshot = snapshot
+        for name, type_code in SECTIONS:
+            start, length = sections[name]
+            view = snapshot.data[start:start + length]
+            setattr(self, name, view.cast(type_code) if length else array(type_code))
+        start, length = sections["json"]
+        self.json = snapshot.data[start:start + length]
+
+    def area(self, position: int) -> Tuple[List[int], List[int], bytes]:
+        """(boundary minutes, status codes, schedule JSON) of the area at a position"""
+        first, last = self.area_offsets[position], self.area_offsets[position + 1]
+        base = position * MINUTES_PER_DAY
+        boundaries = [key - base for key in self.keys[first:last]]
+        codes = list(self.codes[first:last])
+        schedule_json = bytes(self.json[self.json_offsets[position]:self.json_offsets[position + 1]])
+        return boundaries, codes, schedule_json
+
+
+class CompiledSnapshot:
+    """A snapshot file mapped read-only; the mapping stays open for the process lifetime"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            self._mapping = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self._mapping)
+        header_start = len(MAGIC) + HEADER_LENGTH.size
+        if len(self.data) < header_start or bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a compiled schedule snapshot")
+        (header_length,) = HEADER_LENGTH.unpack_from(self.data, len(MAGIC))
+        header = json.loads(bytes(self.data[header_start:header_start + header_length]))
+        if header["format"] != FORMAT_VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written by another version or platform")
+
+        # Section offsets are relative to the first aligned byte after the header
+        body = header_start + header_length + _pad(header_start + header_length)
+        self.data = self.data[body:]
+        if any(start + length > len(self.data)
+               for sections in header["statuses"].values() for start, length in sections.values()):
+            raise ValueError(f"{path} is truncated")
+        self.fingerprint: str = header["fingerprint"]
+        self.areas: List[Tuple[str, str]] = [tuple(area) for area in header["areas"]]
+        self.statuses = {status: SnapshotStatus(self, sections) for status, sections in header["statuses"].items()}
+        self._positions: Optional[Dict[Tuple[str, str], int]] = None
+
+    @property
+    def positions(self) -> Dict[Tuple[str, str], int]:
+        """Position of every area in the snapshot, built on first use"""
+        if self._positions is None:
+            self._positions = {area_key: position for position, area_key in enumerate(self.areas)}
+        return self._positions
+
+    def position(self, municipality: str, area: str) -> Optional[int]:
+        """An area's position in the snapshot, or None if it has no schedule"""
+        return self.positions.get((municipality, area))
+
+
+def load_snapshot(path: Optional[str] = None) -> Optional[CompiledSnapshot]:
+    """The snapshot at `path` (default SCHEDULE_SNAPSHOT), or None when none is configured"""
+    path = path if path is not None else os.environ.get("SCHEDULE_SNAPSHOT")
+    if not path:
+        return None
+    return CompiledSnapshot(path)
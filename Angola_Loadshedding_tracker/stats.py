@@ -0,0 +1,147 @@
+"""
+Outage statistics: how much power each area gets under the active schedules.
+
+Each area's figures come from its compiled interval index (the same one the
+status lookups use), so they include every generated slot but not the
+overrides. Areas are summed per municipality and ranked; the report is
+served pre-encoded from /api/stats.
+"""
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from dataset import MINUTES_PER_DAY, ScheduleDataset
+
+# The evening peak whose power coverage is reported (minutes of the day)
+EVENING_PEAK = (18 * 60, 22 * 60)
+
+# Areas listed in each ranking of the statistics report
+STATS_RANKING_SIZE = 10
+
+
+def time_of_day(minutes: int) -> str:
+    """Minutes since midnight as HH:MM"""
+    return "%02d:%02d" % divmod(minutes % MINUTES_PER_DAY, 60)
+
+
+
+class AreaStats(NamedTuple):
+    """Daily figures of one area's compiled schedule"""
+    on_minutes: int
+    off_minutes: int
+    longest_outage: int  # Longest continuous power-off stretch, across midnight
+    evening_peak_coverage: float  # Share of EVENING_PEAK with power on
+    transitions: int
+
+    @classmethod
+    def from_index(cls, area_index) -> "AreaStats":
+        boundaries = area_index.boundaries + [MINUTES_PER_DAY]
+        runs = [(boundaries[position], boundaries[position + 1], status)
+                for position, status in enumerate(area_index.statuses)]
+
+        on_minutes = sum(end - start for start, end, status in runs if status == "Power on")
+        off_minutes = sum(end - start for start, end, status in runs if status == "Power off")
+        outages = [end - start for start, end, status in runs if status == "Power off"]
+        longest_outage = max(outages, default=0)
+        # An outage running through midnight is one stretch, not two
+        if len(runs) > 1 and runs[0][2] == runs[-1][2] == "Power off":
+            longest_outage = max(longest_outage, outages[0] + outages[-1])
+
+        peak_start, peak_end = EVENING_PEAK
+        peak_on = sum(max(0, min(end, peak_end) - max(start, peak_start))
+                      for start, end, status in runs if status == "Power on")
+        return cls(on_minutes, off_minutes, longest_outage,
+                   round(peak_on / (peak_end - peak_start), 4), len(area_index.change_points))
+
+
+class OutageStats:
+    """
+    Outage statistics of every area under the active schedules, aggregated
+    per municipality and ranked. The report is built once per schedule
+    generation and kept pre-encoded. Per-area figures are remembered per
+    economic status together with the base slots they came from, so a new
+    generation only recomputes the areas whose base schedule changed.
+    `encode` turns the report into JSON bytes.
+    """
+
+    def __init__(self, encode: Callable[[Dict], bytes]):
+        self._encode = encode
+        self._lock = threading.Lock()
+        self._report: Optional[Tuple[str, bytes]] = None  # (generation.dataset_version, report)
+        # economic status -> (municipality, area) -> (base slot signature, stats)
+        self._areas: Dict[str, Dict[Tuple[str, str], Tuple[Tuple, AreaStats]]] = {}
+        self.recomputed = 0  # Areas recomputed while building the last report
+
+    def report_json(self, active, dataset: ScheduleDataset) -> bytes:
+        """The report for a generation of `dataset`'s schedules, pre-encoded as JSON"""
+        # Overrides do not enter the statistics, so override writes keep the report
+        key = f"{active.generation}.{active.dataset_version}"
+        report = self._report
+        if report is not None and report[0] == key:
+            return report[1]
+        with self._lock:
+            report = self._report
+            if report is None or report[0] != key:
+                report = (key, self._encode(self._build(active, dataset)))
+                self._report = report
+            return report[1]
+
+    def _area_stats(self, active, dataset: ScheduleDataset) -> Dict[Tuple[str, str], AreaStats]:
+        previous = self._areas.get(active.status, {})
+        current = {}
+        self.recomputed = 0
+        for municipality, area in dataset.scheduled_areas():
+            base_slots = dataset.slots(municipality, area)
+            area_index = active.index(municipality, area)
+            if not base_slots or area_index is None:
+                continue
+            signature = tuple((slot.start, slot.end, slot.power_on) for slot in base_slots)
+            known = previous.get((municipality, area))
+            if known is not None and known[0] == signature:
+                current[(municipality, area)] = known
+            else:
+                current[(municipality, area)] = (signature, AreaStats.from_index(area_index))
+                self.recomputed += 1
+        self._areas[active.status] = current
+        return {key: stats for key, (_, stats) in current.items()}
+
+    def _build(self, active, dataset: ScheduleDataset) -> Dict:
+        area_stats = self._area_stats(active, dataset)
+
+        areas: Dict[str, Dict[str, Dict]] = {}
+        municipalities: Dict[str, Dict] = {}
+        for (municipality, area), stats in area_stats.items():
+            areas.setdefault(municipality, {})[area] = stats._asdict()
+            summary = municipalities.setdefault(municipality, {
+                "areas": 0, "on_minutes": 0, "off_minutes": 0, "longest_outage": 0,
+                "evening_peak_coverage": 0.0})
+            summary["areas"] += 1
+            summary["on_minutes"] += stats.on_minutes
+            summary["off_minutes"] += stats.off_minutes
+            summary["longest_outage"] = max(summary["longest_outage"], stats.longest_outage)
+            summary["evening_peak_coverage"] += stats.evening_peak_coverage
+
+        for summary in municipalities.values():
+            summary["on_share"] = round(summary["on_minutes"] / (summary["areas"] * MINUTES_PER_DAY), 4)
+            summary["evening_peak_coverage"] = round(summary["evening_peak_coverage"] / summary["areas"], 4)
+        by_share = sorted(municipalities, key=lambda name: -municipalities[name]["on_share"])
+        for rank, name in enumerate(by_share, 1):
+            municipalities[name]["rank"] = rank
+
+        def top_areas(key) -> List[Dict]:
+            ranked = sorted(area_stats.items(), key=lambda item: key(item[1]))[:STATS_RANKING_SIZE]
+            return [{"municipality": municipality, "area": area} for (municipality, area), _ in ranked]
+
+        return {
+            "economic_status": active.status,
+            "generation": active.generation,
+            "evening_peak": {"start": time_of_day(EVENING_PEAK[0]), "end": time_of_day(EVENING_PEAK[1])},
+            "areas": areas,
+            "municipalities": municipalities,
+            "rankings": {
+                "municipalities_by_power": by_share,
+                "most_power": top_areas(lambda stats: -stats.on_minutes),
+                "least_power": top_areas(lambda stats: stats.on_minutes),
+                "longest_outages": top_areas(lambda stats: -stats.longest_outage),
+                "worst_evening_peak": top_areas(lambda stats: stats.evening_peak_coverage)
+            }
+        }
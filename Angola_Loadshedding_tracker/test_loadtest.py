@@ -0,0 +1,30 @@
+"""
+Checks of the load test's latency statistics.
+
+    pip install '.[test]'
+    python -m pytest -q
+"""
+import pytest
+
+from loadtest import percentile
+
+
+@pytest.mark.parametrize("count, fraction, rank", [
+    (100, 0.50, 50),
+    (100, 0.90, 90),
+    (100, 0.99, 99),
+    (200, 0.99, 198),
+    (300, 0.50, 150),
+    (300, 0.99, 297),
+    (1, 0.99, 1),
+    (3, 0.50, 2),
+])
+def test_percentile_is_nearest_rank(count, fraction, rank):
+    # Value k is the k-th smallest, so the result is the rank it was taken from
+    assert percentile([float(value) for value in range(1, count + 1)], fraction) == rank
+
+
+def test_percentile_edges():
+    assert percentile([], 0.99) == 0.0
+    assert percentile([5.0, 7.0], 0.0) == 5.0
+    assert percentile([5.0, 7.0], 1.0) == 7.0
@@ -0,0 +1,143 @@
+"""
+Property checks for schedule generation.
+
+Every generated day must cover 24 hours exactly, with no gaps or overlaps
+and no slot under the MIN_SLOT_MINUTES floor, for every built-in area
+under every economic status and for random slot layouts and multipliers.
+The random cases come from a fixed seed, so a failure can be reproduced.
+Full regenerations must also stay inside a time budget.
+
+    pip install '.[test]'
+    python -m pytest -q
+"""
+import random
+import time
+
+import pytest
+
+import app as schedule_app
+from app import (
+    BASE_SCHEDULES, ECONOMIC_STATUSES, MAX_SIMULATION_MULTIPLIER, MIN_SLOT_MINUTES, MUNICIPALITIES,
+    CompiledSchedules, IntervalIndex, SlotTable, build_area_schedule, rescale_durations, time_to_minutes
+)
+from dataset import MINUTES_PER_DAY, InMemoryDataset, Slot
+
+RANDOM_CASES = 2000
+SEED = 20250601
+
+# Seconds one full regeneration (every area, one economic status) may take
+BUILTIN_REGENERATION_BUDGET = 0.25
+SYNTHETIC_AREAS = 10_000
+SYNTHETIC_REGENERATION_BUDGET = 3.0
+
+
+def builtin_areas():
+    dataset = InMemoryDataset(MUNICIPALITIES, BASE_SCHEDULES)
+    return [pytest.param(municipality, area, dataset.slots(municipality, area), id=f"{municipality}/{area}")
+            for municipality, area in dataset.scheduled_areas() if dataset.slots(municipality, area)]
+
+
+def random_slots(rng: random.Random):
+    """Contiguous base slots covering a day from a random start, in random lengths"""
+    count = rng.randint(1, 12)
+    cuts = sorted(rng.sample(range(1, MINUTES_PER_DAY), count - 1))
+    start = rng.randrange(MINUTES_PER_DAY)
+    slots = []
+    for first, last in zip([0] + cuts, cuts + [MINUTES_PER_DAY]):
+        slots.append(Slot((start + first) % MINUTES_PER_DAY, (start + last) % MINUTES_PER_DAY,
+                          rng.random() < 0.5))
+    return slots
+
+
+def random_multiplier(rng: random.Random) -> float:
+    # Include the edges, where the floor and the even share take over
+    return rng.choice([0.0, MAX_SIMULATION_MULTIPLIER, rng.uniform(0.0, MAX_SIMULATION_MULTIPLIER)])
+
+
+def assert_covers_day(schedule, slot_count):
+    durations = []
+    for slot, following in zip(schedule, schedule[1:] + schedule[:1]):
+        # Back to back, and the last slot ends where the first starts
+        assert slot["end"] == following["start"]
+        durations.append((time_to_minutes(slot["end"]) - time_to_minutes(slot["start"])) % MINUTES_PER_DAY
+                         or MINUTES_PER_DAY)
+    assert sum(durations) == MINUTES_PER_DAY
+    assert min(durations) >= min(MIN_SLOT_MINUTES, MINUTES_PER_DAY // slot_count)
+
+    # Every minute of the day has a known status
+    area_index = IntervalIndex.from_schedule(schedule)
+    assert all(area_index.status_at(minute) != "Unknown" for minute in range(MINUTES_PER_DAY))
+
+
+@pytest.mark.parametrize("status_key", list(ECONOMIC_STATUSES))
+@pytest.mark.parametrize("municipality, area, base_slots", builtin_areas())
+def test_builtin_schedules_cover_the_day(municipality, area, base_slots, status_key):
+    schedule = build_area_schedule(base_slots, ECONOMIC_STATUSES[status_key])
+    assert len(schedule) == len(base_slots)
+    assert [slot["status"] for slot in schedule] == [slot.status for slot in base_slots]
+    assert_covers_day(schedule, len(base_slots))
+
+
+def test_random_durations_sum_to_a_day():
+    rng = random.Random(SEED)
+    for _ in range(RANDOM_CASES):
+        durations = [rng.randint(1, MINUTES_PER_DAY) for _ in range(rng.randint(1, 24))]
+        power_on = [rng.random() < 0.5 for _ in durations]
+        adjusted = rescale_durations(durations, power_on, random_multiplier(rng), random_multiplier(rng))
+        assert all(isinstance(minutes, int) for minutes in adjusted)
+        assert sum(adjusted) == MINUTES_PER_DAY
+        assert min(adjusted) >= min(MIN_SLOT_MINUTES, MINUTES_PER_DAY // len(durations))
+
+
+def test_random_schedules_cover_the_day():
+    rng = random.Random(SEED + 1)
+    for _ in range(RANDOM_CASES):
+        base_slots = random_slots(rng)
+        status = schedule_app.EconomicStatus("Random", random_multiplier(rng), random_multiplier(rng), "")
+        assert_covers_day(build_area_schedule(base_slots, status), len(base_slots))
+
+
+@pytest.mark.parametrize("vectorized", [True, False] if schedule_app.np is not None else [False])
+def test_slot_table_matches_rescale_durations(monkeypatch, vectorized):
+    if not vectorized:
+        monkeypatch.setattr(schedule_app, "np", None)
+    dataset = InMemoryDataset(MUNICIPALITIES, BASE_SCHEDULES)
+    table = SlotTable(dataset)
+    rng = random.Random(SEED + 2)
+    multipliers = [(status.power_on_multiplier, status.power_off_multiplier)
+                   for status in ECONOMIC_STATUSES.values()]
+    multipliers += [(random_multiplier(rng), random_multiplier(rng)) for _ in range(200)]
+
+    for on_multiplier, off_multiplier in multipliers:
+        on_minutes, off_minutes = table.daily_minutes(on_multiplier, off_multiplier)
+        for (municipality, area), area_on, area_off in zip(table.areas, on_minutes, off_minutes):
+            base_slots = dataset.slots(municipality, area)
+            adjusted = rescale_durations([slot.duration for slot in base_slots],
+                                         [slot.power_on for slot in base_slots], on_multiplier, off_multiplier)
+            expected_on = sum(minutes for minutes, slot in zip(adjusted, base_slots) if slot.power_on)
+            assert (area_on, area_off) == (expected_on, MINUTES_PER_DAY - expected_on)
+
+
+def regeneration_seconds(dataset, status_key: str) -> float:
+    """Best of three full regenerations of every area for one economic status"""
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        CompiledSchedules(dataset, status_key).warm()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+@pytest.mark.parametrize("status_key", list(ECONOMIC_STATUSES))
+def test_builtin_regeneration_budget(status_key):
+    dataset = InMemoryDataset(MUNICIPALITIES, BASE_SCHEDULES)
+    assert regeneration_seconds(dataset, status_key) < BUILTIN_REGENERATION_BUDGET
+
+
+def test_synthetic_regeneration_budget():
+    templates = [slots for areas in BASE_SCHEDULES.values() for slots in areas.values() if slots]
+    municipalities = [{"name": "Synthetic", "areas": [f"Area {number}" for number in range(SYNTHETIC_AREAS)]}]
+    base_schedules = {"Synthetic": {f"Area {number}": templates[number % len(templates)]
+                                    for number in range(SYNTHETIC_AREAS)}}
+    dataset = InMemoryDataset(municipalities, base_schedules)
+    assert regeneration_seconds(dataset, "critical") < SYNTHETIC_REGENERATION_BUDGET
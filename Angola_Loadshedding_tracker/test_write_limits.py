@@ -0,0 +1,76 @@
+"""
+Checks of the per-client write rate limit, directly connected and behind
+trusted proxies.
+
+Every write here is an invalid economic status: it spends a write token
+and is answered 400, so no test changes the active schedules.
+
+    pip install '.[test]'
+    python -m pytest -q
+"""
+import pytest
+
+import app as schedule_app
+from writes import RateLimiter, client_address
+
+BAD_WRITE = {"status": "no-such-status"}
+PROXY = "10.0.0.1"
+
+
+@pytest.fixture
+def one_write_each(monkeypatch):
+    """A limiter letting each client make one write, then none for a minute"""
+    monkeypatch.setattr(schedule_app, "write_limiter", RateLimiter(1 / 60, 1, 100))
+
+
+def flask_write(forwarded_for=None, remote_addr=PROXY) -> int:
+    client = schedule_app.app.test_client()
+    headers = {"X-Forwarded-For": forwarded_for} if forwarded_for else {}
+    return client.post("/api/economic-status", json=BAD_WRITE, headers=headers,
+                       environ_base={"REMOTE_ADDR": remote_addr}).status_code
+
+
+def test_direct_clients_have_their_own_buckets(one_write_each):
+    assert flask_write(remote_addr="192.0.2.1") == 400
+    assert flask_write(remote_addr="192.0.2.1") == 429
+    assert flask_write(remote_addr="192.0.2.2") == 400
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(one_write_each):
+    assert flask_write("192.0.2.1") == 400
+    # Anyone could send the header, so it must not buy a fresh bucket
+    assert flask_write("192.0.2.2") == 429
+
+
+def test_clients_behind_a_trusted_proxy_have_their_own_buckets(monkeypatch, one_write_each):
+    monkeypatch.setattr(schedule_app, "TRUSTED_PROXIES", 1)
+    assert flask_write("192.0.2.1") == 400
+    assert flask_write("192.0.2.1") == 429
+    assert flask_write("192.0.2.2") == 400
+    # Hops the client added before the trusted proxy's do not count
+    assert flask_write("198.51.100.7, 192.0.2.1") == 429
+
+
+def test_only_trusted_hops_are_read():
+    assert client_address(PROXY, "198.51.100.7, 192.0.2.1, 10.0.0.2", 2) == "192.0.2.1"
+    # Fewer hops than proxies: the request did not come through all of them
+    assert client_address(PROXY, "192.0.2.1", 2) == PROXY
+    assert client_address(PROXY, None, 2) == PROXY
+    assert client_address(PROXY, "192.0.2.1", 0) == PROXY
+
+
+def test_asgi_writes_follow_trusted_proxies(monkeypatch, one_write_each):
+    pytest.importorskip("a2wsgi")
+    testclient = pytest.importorskip("starlette.testclient")
+    import asgi
+
+    monkeypatch.setattr(schedule_app, "TRUSTED_PROXIES", 1)
+    client = testclient.TestClient(asgi.app)
+
+    def asgi_write(forwarded_for: str) -> int:
+        return client.post("/api/economic-status", json=BAD_WRITE,
+                           headers={"X-Forwarded-For": forwarded_for}).status_code
+
+    assert asgi_write("192.0.2.1") == 400
+    assert asgi_write("192.0.2.1") == 429
+    assert asgi_write("192.0.2.2") == 400
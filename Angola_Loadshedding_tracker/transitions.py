@@ -0,0 +1,287 @@
+"""
+Status transitions: a background timer that flips every area's status at
+its schedule boundaries, and the hub that pushes those flips to event
+stream subscribers.
+
+The timer keeps a snapshot of every area's current status, valid until the
+next boundary of any area (or override), so reading the status "now" is a
+dict lookup until then. Both the boundaries and the statuses are read off
+the generation's packed index.
+"""
+import bisect
+import datetime
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from clock import Clock, minute_of_day
+from dataset import MINUTES_PER_DAY
+from overrides import OverrideSet
+
+# Longest the transition timer sleeps before checking for schedule changes
+# made by other workers (seconds)
+TRANSITION_POLL_SECONDS = 1.0
+
+# How long the transition timer waits after being told the schedules changed,
+# so a burst of changes costs one snapshot rebuild and one notification
+SCHEDULE_CHANGE_SETTLE_SECONDS = 0.05
+
+
+class StatusSnapshot(NamedTuple):
+    """Status of every area, valid from one status change until the next"""
+    tag: str  # ScheduleGeneration.tag the snapshot was computed from
+    valid_from: datetime.datetime
+    valid_until: datetime.datetime
+    statuses: Dict[Tuple[str, str], str]
+
+
+class TransitionScheduler:
+    """
+    Background timer that knows the next instant any area's status changes.
+
+    It keeps a materialized snapshot of every area's current status, flipped
+    exactly at status boundaries, so "what is the status now" becomes a dict
+    lookup. Listeners (such as the push channel) are told which areas changed
+    at each boundary and when the schedules themselves change. The thread
+    starts on first use in each worker process.
+
+    Both are read off the packed index. With lazily compiled schedules (a
+    SQLite dataset without a snapshot) the timer does not compile every area
+    for its own sake: until something builds the packed index, or an event
+    stream asks for transitions, there is no snapshot and readers use the
+    areas' own indexes.
+
+    `refresh` returns the active schedule generation (catching up with
+    other workers' changes), `current_clock` the clock to follow and
+    `logger` records failed ticks.
+    """
+
+    def __init__(self, refresh: Callable[[], Any], current_clock: Callable[[], Clock], logger: logging.Logger):
+        self._refresh = refresh
+        self._clock = current_clock
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners = []
+        self.snapshot: Optional[StatusSnapshot] = None
+        self._follow_all = False
+        # Timer state, only touched by the timer thread
+        self._tag: Optional[str] = None
+        self._packed = None  # Packed index the transition table was read from
+        self._transitions: Dict[int, List[Tuple[str, str]]] = {}
+        self._change_minutes: List[int] = []
+        self._last_minute: Optional[datetime.datetime] = None
+
+    def add_listener(self, listener) -> None:
+        """Register an object with on_transitions() and on_schedules_changed() methods"""
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="transition-scheduler", daemon=True)
+                self._thread.start()
+
+    def follow_all(self) -> None:
+        """Follow every area's transitions even where that compiles every area (event streams need them)"""
+        if not self._follow_all:
+            self._follow_all = True
+            self._wake.set()
+        self.start()
+
+    def schedules_changed(self) -> None:
+        """
+        Wake the timer to rebuild the snapshot and notify listeners. Changes
+        within SCHEDULE_CHANGE_SETTLE_SECONDS of each other are handled together.
+        """
+        self._wake.set()
+
+    def current(self, moment: datetime.datetime, active) -> Optional[StatusSnapshot]:
+        """The snapshot if it was built from `active` and covers the moment, else None"""
+        snapshot = self.snapshot
+        if (snapshot is None or snapshot.tag != active.tag
+                or not snapshot.valid_from <= moment < snapshot.valid_until):
+            return None
+        return snapshot
+
+    def status(self, municipality: str, area: str, moment: datetime.datetime,
+               active) -> Optional[str]:
+        """An area's status from the snapshot, or None if the snapshot does not cover the moment"""
+        snapshot = self.current(moment, active)
+        if snapshot is None:
+            return None
+        return snapshot.statuses.get((municipality, area), "Unknown")
+
+    def _run(self) -> None:
+        while True:
+            try:
+                sleep_for = self._tick()
+            except Exception:
+                self._logger.exception("Transition scheduler tick failed")
+                sleep_for = TRANSITION_POLL_SECONDS
+            if self._wake.wait(sleep_for):
+                # Readers fall back to the schedules meanwhile (the snapshot's tag is stale)
+                time.sleep(SCHEDULE_CHANGE_SETTLE_SECONDS)
+            self._wake.clear()
+
+    def _build(self, active, now: datetime.datetime, minute: datetime.datetime) -> None:
+        """The transition table and the snapshot of a generation, or neither if its packed index is not built"""
+        packed = active.packed if self._follow_all else active.compiled.packed_if_ready()
+        self._packed = packed
+        if packed is None:
+            self._transitions = {}
+            self._change_minutes = []
+            self.snapshot = None
+            return
+
+        self._transitions = {
+            change_minute: [packed.areas[position] for position in positions]
+            for change_minute, positions in packed.change_points().items()
+        }
+        self._change_minutes = sorted(self._transitions)
+
+        statuses = dict(zip(packed.areas, packed.statuses_at(range(len(packed.areas)), minute_of_day(now))))
+        for key, status in active.overrides.statuses_at(now.timestamp()).items():
+            if key in statuses:
+                statuses[key] = status
+        self.snapshot = StatusSnapshot(active.tag, minute, self._next_change(now, active.overrides), statuses)
+
+    def _next_change(self, now: datetime.datetime, overrides: OverrideSet) -> datetime.datetime:
+        """The next instant any area's schedule or override changes (far future if none ever does)"""
+        next_change = datetime.datetime.max.replace(tzinfo=now.tzinfo)
+        if self._change_minutes:
+            position = bisect.bisect_right(self._change_minutes, minute_of_day(now))
+            next_minute = (self._change_minutes[position] if position < len(self._change_minutes)
+                           else self._change_minutes[0] + MINUTES_PER_DAY)
+            next_change = (now.replace(hour=0, minute=0, second=0, microsecond=0)
+                           + datetime.timedelta(minutes=next_minute))
+        override_change = overrides.next_change_after(now.timestamp())
+        if override_change is not None:
+            next_change = min(next_change, datetime.datetime.fromtimestamp(override_change, now.tzinfo))
+        return next_change
+
+    def _tick(self) -> float:
+        """Flip everything that became due; returns how long to sleep"""
+        active = self._refresh()
+        clock = self._clock()
+        now = clock.now()
+        minute = now.replace(second=0, microsecond=0)
+
+        # Rebuild when the schedules change, and when the clock jumps (a
+        # replaced or frozen clock) rather than replaying every minute between
+        clock_jumped = self._last_minute is not None and not (
+            self._last_minute <= minute <= self._last_minute + datetime.timedelta(days=1))
+        if active.tag != self._tag or clock_jumped or self.snapshot is None:
+            self._build(active, now, minute)
+            if self._tag is not None and active.tag != self._tag:
+                for listener in self._listeners:
+                    listener.on_schedules_changed(active, now)
+            self._tag = active.tag
+            self._last_minute = minute
+
+        if self.snapshot is None:
+            return TRANSITION_POLL_SECONDS
+
+        # Flip every minute boundary passed since the last wake-up. Override
+        # boundaries fall on whole minutes, and only areas whose status really
+        # changes (not one hidden by an override) are reported.
+        while self._last_minute < minute:
+            self._last_minute += datetime.timedelta(minutes=1)
+            due = (self._transitions.get(minute_of_day(self._last_minute), [])
+                   + active.overrides.changes.get(self._last_minute.timestamp(), []))
+            statuses = self.snapshot.statuses
+            changed = []
+            if due:
+                statuses = dict(statuses)
+                packed = self._packed
+                positions = [packed.positions[key] for key in dict.fromkeys(due) if key in packed.positions]
+                scheduled = packed.statuses_at(positions, minute_of_day(self._last_minute))
+                timestamp = self._last_minute.timestamp()
+                for position, scheduled_status in zip(positions, scheduled):
+                    key = packed.areas[position]
+                    status = active.overrides.status_at(*key, timestamp) or scheduled_status
+                    if statuses.get(key) != status:
+                        statuses[key] = status
+                        changed.append(key)
+            self.snapshot = StatusSnapshot(
+                active.tag, self._last_minute, self._next_change(self._last_minute, active.overrides), statuses)
+            if changed:
+                for listener in self._listeners:
+                    listener.on_transitions(active, self._last_minute, changed)
+
+        until_change = clock.real_seconds((self.snapshot.valid_until - now).total_seconds())
+        if until_change is None:
+            return TRANSITION_POLL_SECONDS
+        return min(TRANSITION_POLL_SECONDS, max(until_change, 0))
+
+
+class TransitionHub:
+    """
+    Fans status changes out to event stream subscribers.
+
+    Listens to the transition scheduler and pushes pre-encoded events onto the
+    queues of the affected area's subscribers and of the all-area subscribers.
+    Connections only block on their own queue, so idle subscribers cost no
+    timers of their own. A subscriber is anything with a thread-safe put()
+    method; by default it is a queue.SimpleQueue.
+
+    `area_event(active, municipality, area, moment)` and
+    `snapshot_event(active, moment)` encode the events pushed for one area
+    and for all of them.
+    """
+
+    def __init__(self, scheduler: TransitionScheduler, area_event: Callable[..., bytes],
+                 snapshot_event: Callable[..., bytes]):
+        self._scheduler = scheduler
+        self._area_event = area_event
+        self._snapshot_event = snapshot_event
+        self._lock = threading.Lock()
+        # Keyed by (municipality, area); None holds the all-area subscribers
+        self._subscribers: Dict[Optional[Tuple[str, str]], Set] = {}
+
+    def subscribe(self, key: Optional[Tuple[str, str]], subscriber=None):
+        if subscriber is None:
+            subscriber = queue.SimpleQueue()
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscriber)
+        self._scheduler.follow_all()
+        return subscriber
+
+    def unsubscribe(self, key: Optional[Tuple[str, str]], subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[key]
+
+    def _publish(self, keys: Sequence[Optional[Tuple[str, str]]], message: bytes) -> None:
+        with self._lock:
+            targets = [subscriber for key in keys for subscriber in self._subscribers.get(key, ())]
+        for subscriber in targets:
+            subscriber.put(message)
+
+    def _subscribed(self, key: Optional[Tuple[str, str]]) -> bool:
+        # Events are only built for someone, as building one can compile its area (or all of them)
+        return key in self._subscribers
+
+    def on_transitions(self, active, moment: datetime.datetime,
+                       areas: List[Tuple[str, str]]) -> None:
+        for municipality, area in areas:
+            if self._subscribed((municipality, area)) or self._subscribed(None):
+                self._publish([(municipality, area), None],
+                              self._area_event(active, municipality, area, moment))
+
+    def on_schedules_changed(self, active, moment: datetime.datetime) -> None:
+        with self._lock:
+            area_keys = [key for key in self._subscribers if key is not None]
+        for municipality, area in area_keys:
+            self._publish([(municipality, area)], self._area_event(active, municipality, area, moment))
+        if self._subscribed(None):
+            self._publish([None], self._snapshot_event(active, moment))
@@ -0,0 +1,106 @@
+"""
+The write path: per-client rate limits on the write endpoints, and
+economic status writes applied one at a time with bursts coalesced.
+
+Writes change every area's schedule at once, so a client hammering them
+(or a burst from many clients) would otherwise recompile and invalidate
+everything on each request.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from metrics import Counter
+
+
+class RateLimiter:
+    """
+    Token bucket per client: a bucket holds up to `burst` tokens, refills at
+    `rate` tokens per second and each request spends one. The least recently
+    seen clients are forgotten beyond `max_clients` (forgetting only refills).
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, client: str) -> float:
+        """Spend a token: 0 if the request may go ahead, else the seconds until one is available"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def client_address(remote_addr: Optional[str], forwarded_for: Optional[str], trusted_proxies: int) -> str:
+    """
+    The address a client's writes are counted against: the connecting
+    address, or behind `trusted_proxies` proxies the one the outermost of
+    them forwarded in X-Forwarded-For
+    """
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return remote_addr or ""
+
+
+class StatusWriter:
+    """
+    Applies economic status writes one at a time and coalesces bursts: while
+    one write is being applied, the writes arriving behind it only record the
+    status they ask for, and the next of them to run activates the latest
+    status for all of them at once. A burst of N writes thus costs one or two
+    activations (and downstream invalidations) instead of N. Each writer gets
+    the generation that includes its write; the last write wins.
+
+    `activate` switches to a status and returns the new generation,
+    `changed` is called after every activation and `coalesced` counts the
+    writes that were covered by another one's activation.
+    """
+
+    def __init__(self, activate: Callable[[str], Any], changed: Callable[[], None], coalesced: Counter):
+        self._activate = activate
+        self._changed = changed
+        self._coalesced = coalesced
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._pending: Optional[str] = None
+        self._requested = 0  # Writes received
+        self._applied = 0  # Writes covered by the last activation
+        self._result = None
+
+    def write(self, economic_status: str):
+        with self._lock:
+            self._requested += 1
+            ticket = self._requested
+            self._pending = economic_status
+
+        with self._apply_lock:
+            if self._applied >= ticket:
+                self._coalesced.inc()
+                return self._result
+            with self._lock:
+                economic_status = self._pending
+                covered = self._requested
+            active = self._activate(economic_status)
+            self._result = active
+            self._applied = covered
+
+        self._changed()
+        return active